@@ -4,6 +4,7 @@ Created on 07/11/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 from environment import Environment, ENV_SINGLE_STATE
+from learner import ACT_PHASES, FEEDBACK_PHASES
 
 class TwoPlayerTwoAction(Environment):
     
@@ -74,17 +75,8 @@ class TwoPlayerTwoAction(Environment):
     
     def __run_feedbacks(self, p1, p2, r1, r2):
         
-        # feedback 1
-        p1.feedback1(r1, ENV_SINGLE_STATE)
-        p2.feedback1(r2, ENV_SINGLE_STATE)
-        
-        # feedback 2
-        p1.feedback2(r1, ENV_SINGLE_STATE)
-        p2.feedback2(r2, ENV_SINGLE_STATE)
-        
-        # feedback 3
-        p1.feedback3(r1, ENV_SINGLE_STATE)
-        p2.feedback3(r2, ENV_SINGLE_STATE)
+        # feedback 1-3 (only for the players that use them, see Environment.run_phases)
+        self.run_phases(FEEDBACK_PHASES, [p1.get_name(), p2.get_name()], [r1, r2], [ENV_SINGLE_STATE, ENV_SINGLE_STATE])
         
         # feedback last
         p1.feedback_last(r1, ENV_SINGLE_STATE)
@@ -92,21 +84,8 @@ class TwoPlayerTwoAction(Environment):
         
     def __run_acts(self, p1, p2):
         
-        # act 1
-        _ = p1.act1()
-        _ = p2.act1()
-        
-        # act 2
-        _ = p1.act2()
-        _ = p2.act2()
-        
-        # act 3
-        _ = p1.act3()
-        _ = p2.act3()
-        
-        # act 4
-        _ = p1.act4()
-        _ = p2.act4()
+        # act 1-4 (only for the players that use them, see Environment.run_phases)
+        self.run_phases(ACT_PHASES, [p1.get_name(), p2.get_name()])
         
         # act last
         _,a1 = p1.act_last()
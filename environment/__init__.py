@@ -4,6 +4,7 @@ Created on 08/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 import abc
+from learner import ACT_PHASES, FEEDBACK_PHASES
 
 ENV_SINGLE_STATE = "***SINGLE_STATE***"
 
@@ -14,6 +15,14 @@ class Environment(object):
     def __init__(self):
         self._learners = {}
         
+        #the learners that are members of a population (see learner/population.py),
+        #in the form {name: (population, position of the learner in the population)}
+        self._population_members = {}
+        
+        #the learners (names) that use each optional phase (see Learner.get_phases),
+        #in the form {phase: set of names}
+        self._phase_learners = dict([(phase, set()) for phase in ACT_PHASES + FEEDBACK_PHASES])
+        
         self._episodes = 0
         self._steps = 0
         self._has_episode_ended = False
@@ -59,6 +68,83 @@ class Environment(object):
         if learner.get_name() in self._learners:
             raise Exception("Learner %s has already registered to %s!" % (learner.get_name(), self.__str__()))
         self._learners[learner.get_name()] = learner
+        if hasattr(learner, 'get_population'):
+            self._population_members[learner.get_name()] = learner.get_population()
+        for phase in learner.get_phases():
+            self._phase_learners[phase].add(learner.get_name())
+    
+    #run the given optional phases (eg, ACT_PHASES or FEEDBACK_PHASES, see
+    #learner/__init__.py) on the given learners (names), one phase after the
+    #other, where args are lists with the arguments of each learner (eg, the
+    #rewards and the new states in the feedback phases); each phase is run only
+    #on the learners that use it (see Learner.get_phases), so that the phases not
+    #used by any learner cost nothing
+    def run_phases(self, phases, names, *args):
+        for phase in phases:
+            learners = self._phase_learners[phase]
+            if not learners:
+                continue
+            for k, name in enumerate(names):
+                if name in learners:
+                    getattr(self._learners[name], phase)(*[a[k] for a in args])
+    
+    #group the given learners (names) by population (see learner/population.py),
+    #returning the positions (in names) of the learners that are not members of
+    #any population and, for each population, a triple (population, positions
+    #in names, positions of the learners in the population)
+    def __group_by_population(self, names):
+        members = [self._population_members.get(name) for name in names]
+        
+        individuals = [k for k, m in enumerate(members) if m is None]
+        
+        groups = []
+        for population in set([m[0] for m in members if m is not None]):
+            positions = [k for k, m in enumerate(members) if m is not None and m[0] is population]
+            groups.append((population, positions, [members[k][1] for k in positions]))
+        
+        return individuals, groups
+    
+    #let the given learners (names) choose their actions, as in Learner.act_last,
+    #where states and available_actions are lists with the arguments of each
+    #learner (None for the learners' defaults); the members of a population of
+    #learners (see learner/population.py) make their choices in a single call
+    #per population; return a dictionary {name: [state, action]}
+    def act_last_batch(self, names, states=None, available_actions=None):
+        if states is None:
+            states = [None] * len(names)
+        if available_actions is None:
+            available_actions = [None] * len(names)
+        
+        individuals, groups = self.__group_by_population(names)
+        
+        ret = {}
+        for k in individuals:
+            ret[names[k]] = self._learners[names[k]].act_last(states[k], available_actions[k])
+        
+        for population, positions, agents in groups:
+            state_action = population.act_last_batch(agents, [states[k] for k in positions], [available_actions[k] for k in positions])
+            ret.update(zip([names[k] for k in positions], state_action))
+        
+        return ret
+    
+    #send to the given learners (names) the feedback of their actions, as in
+    #Learner.feedback_last, where rewards, new_states, prev_states and prev_actions
+    #are lists with the arguments of each learner (None for the learners'
+    #defaults); the members of a population of learners (see learner/population.py)
+    #are updated in a single call per population
+    def feedback_last_batch(self, names, rewards, new_states, prev_states=None, prev_actions=None):
+        if prev_states is None:
+            prev_states = [None] * len(names)
+        if prev_actions is None:
+            prev_actions = [None] * len(names)
+        
+        individuals, groups = self.__group_by_population(names)
+        
+        for k in individuals:
+            self._learners[names[k]].feedback_last(rewards[k], new_states[k], prev_states[k], prev_actions[k])
+        
+        for population, positions, agents in groups:
+            population.feedback_last_batch(agents, [rewards[k] for k in positions], [new_states[k] for k in positions], [prev_states[k] for k in positions], [prev_actions[k] for k in positions])
     
     #defines what must happen when one prints the learner
     def __str__(self):
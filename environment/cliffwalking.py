@@ -4,6 +4,7 @@ Created on 08/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 from environment import Environment
+from learner import ACT_PHASES, FEEDBACK_PHASES
 import time#@UnusedImport
 
 class CliffWalking(Environment):
@@ -106,14 +107,7 @@ class CliffWalking(Environment):
         #run a step, which corresponds to a RL-cycle, i.e., 
         #the learner acts and receives the corresponding feedback
         learner_feedback = {}
-        for l in self._learners.values():
-            l.act1()
-        for l in self._learners.values():
-            l.act2()
-        for l in self._learners.values():
-            l.act3()
-        for l in self._learners.values():
-            l.act4()
+        self.run_phases(ACT_PHASES, self._learners.keys())
         for l in self._learners.values():
             
             #get the leaner's action
@@ -131,12 +125,8 @@ class CliffWalking(Environment):
             learner_feedback[l] = [r, s_new]
         
         #provide feedback to the learner
-        for l in learner_feedback.keys():
-            l.feedback1(r, s_new)
-        for l in learner_feedback.keys():
-            l.feedback2(r, s_new)
-        for l in learner_feedback.keys():
-            l.feedback3(r, s_new)
+        names = [l.get_name() for l in learner_feedback.keys()]
+        self.run_phases(FEEDBACK_PHASES, names, [r] * len(names), [s_new] * len(names))
         for l in learner_feedback.keys():
             l.feedback_last(r, s_new)
             
@@ -0,0 +1,285 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+from environment import Environment
+from learner import ACT_PHASES, FEEDBACK_PHASES
+import external.KSP as KSP
+from tools import sumoxml
+import numpy as np
+import time
+
+class MacroRouteChoice(Environment):
+
+    def __init__(self, cfg_file, ksp_file):
+
+        super(MacroRouteChoice, self).__init__()
+
+        self.__create_env(cfg_file, ksp_file)
+
+    '''
+    Create the environment as a MDP, in the same way as SUMORouteChoice (see its
+    documentation), but replacing the microscopic simulation by a macroscopic
+    one: the travel time of each route is given by the cost functions of its
+    links (as defined in the KSP network file), evaluated on the links' flows,
+    where the flow of a link is the number of vehicles whose routes include it.
+    As the travel times are computed at once for all vehicles (in vectorised
+    form), an episode takes a tiny fraction of the time of a SUMO simulation,
+    which makes this environment suitable for a fast screening of algorithms.
+    The vehicles (and the OD-matrix) are taken from the route file of the
+    given SUMO configuration file, and the network (with its cost functions)
+    is taken from the given KSP network file (see tools.misc.convert_SUMO_to_KSP).
+    Notice that congestion is only captured if the cost functions depend on
+    the flows: in nets/OW/OW_for_KSP.net, for instance, the cost of each link
+    is its free-flow travel time, so the routes' travel times do not depend
+    on the vehicles' choices; nets/OW/OW_for_KSP_BPR.net has the same links
+    with BPR cost functions instead.
+    '''
+    def __create_env(self, cfg_file, ksp_file):
+
+        # register the input files
+        self.__cfg_file = cfg_file
+        self.__rou_file = sumoxml.read_cfg_files(self.__cfg_file)[1]
+        self.__ksp_file = ksp_file
+
+        # read the network file (as a KSP graph, whose links have cost functions)
+        self.__graph = KSP.loadGraph(self.__ksp_file)
+
+        # create MDP as a dictionary, where:
+        #   * keys represent the OD-pairs (encoded by encode_OD(...) method)
+        #   * the value of each key is a triple <origin, destination, routes>,
+        #     where routes is an array of strings (one per route, each being the
+        #     list of its links separated by spaces)
+        # the routes are set through method set_routes_OD_pair(...)
+        self.__env = {}
+
+        # the routes, identified by their position in the list of routes (the
+        # same route string always has the same ID, even if it is defined for
+        # several OD-pairs), along with the links (CSR ids, see tools.graph) of
+        # each route, as a pair of arrays (route ID, link ID) with one position
+        # per link of each route (the route-link incidence matrix in sparse form)
+        self.__route_ids = {}
+        self.__route_links = []
+        self.__incidence = None
+
+        # create the set of vehicles and the OD-matrix
+        self.__create_vehicles()
+
+    # concatenate the origin and destination strings in the form 'O###D'
+    # where O and D are the origin and destination, respectively
+    def encode_OD(self, origin, destination):
+        return '%s###%s' % (origin, destination)
+
+    # decode the string into an origin and a destination, as opposed
+    # to the concatenation made in encode_OD(...) method
+    def decode_OD(self, string):
+        sp = string.split('###')
+        return sp[0], sp[1]
+
+    # define the set of routes of each OD-pair
+    def set_routes_OD_pair(self, origin, destination, routes):
+
+        # the dictionary key is encoded by encode_OD(...) method
+        key = self.encode_OD(origin, destination)
+
+        # create the entry if it does not yet exist
+        if key not in self.__env:
+            self.__env[key] = [origin, destination, []]
+
+        # store the routes (and register those not yet known)
+        for r in routes:
+            self.__env[key][2].append(r)
+            if r not in self.__route_ids:
+                self.__route_ids[r] = len(self.__route_links)
+                self.__route_links.append(self.__get_route_links(origin, r))
+                self.__incidence = None
+
+    # define the set of routes of each OD-pair as its K shortest paths (see
+    # SUMORouteChoice.set_routes_KSP)
+    def set_routes_KSP(self, ksp_file, K, cache_file=None, processes=1):
+        pairs = self.get_OD_pairs()
+        for (origin, destination), RKSP in zip(pairs, KSP.getKRoutesODListCached(ksp_file, pairs, K, cache_file, processes)):
+            routes = [" ".join(r[0]) for r in RKSP]
+            self.set_routes_OD_pair(origin, destination, routes)
+
+    # return the links (CSR ids) of the given route (a string of links' names
+    # separated by spaces) starting at the given origin; the links are followed
+    # from the origin, so that the two directions of an undirected link (which
+    # share the same name) are told apart
+    def __get_route_links(self, origin, route):
+        csr = self.__graph.csr
+        links = []
+        node = csr.node_ids[origin]
+        for name in route.split(' '):
+            link = None
+            for e in csr.out_edges(node):
+                if csr.edge_names[e] == name:
+                    link = e
+                    break
+            if link is None:
+                raise Exception('Route "%s" is not valid from %s (link %s not found)!' % (route, origin, name))
+            links.append(link)
+            node = csr.targets[link]
+        return links
+
+    # create the set of vehicles and the OD-matrix
+    def __create_vehicles(self):
+
+        # set of all vehicles, where each element in __vehicles correspond to
+        # another in __learners
+        self.__vehicles = {}
+
+        # the OD-matrix as a dictionary
+        # each element key is a OD-pair in the form 'O###D' (see encode_OD(...) method)
+        # each value is a triple <origin, destination, vehicles>, where
+        # the latter correspond to the number of vehicles in that OD-pair
+        self.__OD_matrix = {}
+
+        # process all vehicle entries (the route file is read in a single pass,
+        # see tools/sumoxml.py)
+        for vehID, route, _, _ in sumoxml.read_vehicles(self.__rou_file):
+
+            # origin and destination nodes
+            origin = self.__graph.csr.edge_endpoints(route.split(' ')[0])[0]
+            destination = self.__graph.csr.edge_endpoints(route.split(' ')[-1])[1]
+
+            # create the entry in the dictionary
+            self.__vehicles[vehID] = {
+                'origin': origin,
+                'destination': destination,
+
+                'departure_time': -1.0,
+                'arrival_time': -1.0,
+                'travel_time': -1.0
+            }
+
+            # update/populate __OD_matrix
+            OD = self.encode_OD(origin, destination)
+            num = 1
+            if OD in self.__OD_matrix:
+                num += self.__OD_matrix[OD][2]
+            self.__OD_matrix[OD] = [origin, destination, num]
+
+    # return the set of OD-pairs as an array of arrays, where
+    # each position in the main array corresponds to an OD-pair
+    # and each nested array has two elements, one for origin
+    # and another for destination
+    def get_OD_pairs(self):
+        ret = []
+        for origin, destination, _ in self.__OD_matrix.values():
+            ret.append([origin, destination])
+        return ret
+
+    def get_vehicles_ID_list(self):
+        # return a list with the vehicles' IDs
+        return self.__vehicles.keys()
+
+    def get_vehicle_dict(self, vehID):
+        # return the value in __vehicles corresponding to vehID
+        return self.__vehicles[vehID]
+
+    def get_state_actions(self, state):
+        self.__check_env()
+        return self.__env[state][2]
+
+    # return the network's graph (a KSP graph, see KSP.loadGraph), whose links'
+    # costs correspond to the flows of the last episode
+    def get_graph(self):
+        return self.__graph
+
+    def reset_episode(self):
+
+        super(MacroRouteChoice, self).reset_episode()
+
+        # reset vehicles attributes
+        for vehID in self.get_vehicles_ID_list():
+            self.__vehicles[vehID]['departure_time'] = -1.0
+            self.__vehicles[vehID]['arrival_time'] = -1.0
+            self.__vehicles[vehID]['travel_time'] = -1.0
+
+    # check whether the environment is ready to run
+    def __check_env(self):
+        # check whether the environment data structure was defined
+        if not self.__env:
+            raise Exception("The routes must be set before running! Use set_routes_OD_pair(...) method for this.")
+
+    # return the travel time of each route, given the number of vehicles
+    # choosing each route (an array indexed by route ID)
+    def __calc_routes_travel_times(self, route_flows):
+
+        # the route-link incidence matrix (built only when the routes change)
+        if self.__incidence is None:
+            self.__incidence = [
+                np.array([r for r, links in enumerate(self.__route_links) for _ in links], dtype=np.int64),
+                np.array([e for links in self.__route_links for e in links], dtype=np.int64)
+            ]
+        routes, links = self.__incidence
+
+        # the flow of each link
+        csr = self.__graph.csr
+        link_flows = np.bincount(links, weights=route_flows[routes], minlength=csr.n_edges())
+
+        # the links' costs under such flows (the flows are given in the order of
+        # the edges in the KSP graph, see KSP.updateEdgesCosts)
+        flows = np.zeros(len(self.__graph.E))
+        flows[csr.input_index] = link_flows
+        KSP.updateEdgesCosts(self.__graph, flows=flows)
+
+        # the travel time of each route
+        return np.bincount(routes, weights=csr.costs[links], minlength=len(self.__route_links))
+
+    def run_episode(self, max_steps=-1):
+
+        self.__check_env()
+
+        start = time.time()
+
+        self._has_episode_ended = False
+        self._episodes += 1
+        self.reset_episode()
+
+        # let the learners choose their routes
+        vehicles = self.get_vehicles_ID_list()
+        self.run_phases(ACT_PHASES, vehicles)
+        state_action = self.act_last_batch(vehicles)
+        chosen = np.array([self.__route_ids[state_action[vehID][1]] for vehID in vehicles], dtype=np.int64)
+
+        # calculate the travel time of all vehicles at once
+        travel_times = self.__calc_routes_travel_times(np.bincount(chosen, minlength=len(self.__route_links)).astype(float))[chosen]
+
+        # update the vehicles' attributes
+        vehicles_to_process_feedback = {}
+        for vehID, tt in zip(vehicles, travel_times.tolist()):
+            self.__vehicles[vehID]['departure_time'] = 0.0
+            self.__vehicles[vehID]['arrival_time'] = tt
+            self.__vehicles[vehID]['travel_time'] = tt
+
+            vehicles_to_process_feedback[vehID] = [
+                tt * -1,
+                self.encode_OD(self.__vehicles[vehID]['origin'], self.__vehicles[vehID]['destination'])
+            ]
+        self.__process_vehicles_feedback(vehicles_to_process_feedback)
+
+        # print average travel time (in the units of the cost functions)
+        print '\n***%i\t%s\t%s***' % (self._episodes, travel_times.mean(), time.time() - start)
+
+        self._has_episode_ended = True
+
+    def __process_vehicles_feedback(self, vehicles):
+
+        names = vehicles.keys()
+        args = [[vehicles[vehID][k] for vehID in names] for k in range(2)]
+
+        # feedback1-feedback3 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(FEEDBACK_PHASES, names, *args)
+
+        # feedback_last (in batches, see Environment.feedback_last_batch)
+        self.feedback_last_batch(names, *args)
+
+    def run_step(self):
+        raise Exception('run_step is not available in %s class' % self)
+        return
+
+    def has_episode_ended(self):
+        return self._has_episode_ended
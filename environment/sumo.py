@@ -4,9 +4,13 @@ Created on 11/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 from environment import Environment
+from learner import ACT_PHASES, FEEDBACK_PHASES
+import external.KSP as KSP
+from tools.graph import CSRGraph
 import traci
+from tools import sumobackend
 import sumolib
-from xml.dom import minidom
+from tools import sumoxml
 import sys, os
 import subprocess
 import atexit
@@ -15,11 +19,11 @@ import time
 
 class SUMO(Environment):
     
-    def __init__(self, cfg_file, port=8813, use_gui=False):
+    def __init__(self, cfg_file, port=8813, use_gui=False, use_libsumo=False, reuse_sumo=False):
         
         super(SUMO, self).__init__()
         
-        self.__create_env(cfg_file, port, use_gui)
+        self.__create_env(cfg_file, port, use_gui, use_libsumo, reuse_sumo)
         
     '''
     Create the environment as a MDP. The MDP is modeled as follows:
@@ -29,7 +33,7 @@ class SUMO(Environment):
       time spent on traveling on such a link multiplied by -1 (the lower the travel time the better)
     * the transitions between states are deterministic
     '''
-    def __create_env(self, cfg_file, port, use_gui):
+    def __create_env(self, cfg_file, port, use_gui, use_libsumo, reuse_sumo):
         
         #check for SUMO's binaries
         if use_gui:
@@ -37,10 +41,23 @@ class SUMO(Environment):
         else:
             self._sumo_binary = sumolib.checkBinary('sumo')
         
+        #the backend used to drive the simulation: libsumo (in-process), if
+        #requested and installed, or TraCI otherwise (see tools/sumobackend.py);
+        #the simulation is driven through _traci, which is the connection to
+        #SUMO (labelled by port, so that several environments can run at once)
+        self._backend = sumobackend.get_backend(use_libsumo, use_gui)
+        self._traci = self._backend
+        self.__label = 'port-%i' % port
+        
+        #whether the same SUMO instance is used along all episodes (in which
+        #case the simulation is reloaded at the beginning of each episode,
+        #rather than starting a new SUMO process; see close())
+        self.__reuse_sumo = reuse_sumo
+        self.__sumo_running = False
+        
         #register SUMO/TraCI parameters
         self.__cfg_file = cfg_file
-        self.__net_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + minidom.parse(self.__cfg_file).getElementsByTagName('net-file')[0].attributes['value'].value
-        self.__rou_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + minidom.parse(self.__cfg_file).getElementsByTagName('route-files')[0].attributes['value'].value
+        self.__net_file, self.__rou_file = sumoxml.read_cfg_files(self.__cfg_file)
         self.__port = port
         
         #..............................
@@ -48,17 +65,24 @@ class SUMO(Environment):
         #read the network file
         self.__net = sumolib.net.readNet(self.__net_file)
         
-        #create MDP as a dictionary, where:
-        #  * keys represent the nodes' IDs
-        #  * the value of each key is another dictionary, where:
-        #    - keys are out-links' IDs
-        #    - values are the other end of the links (resulting states)
-        self.__env = {}
-        for s in self.__net.getNodes(): #current states (current nodes)
-            d = {}
-            for a in s.getOutgoing(): #actions (out links)
-                d[a.getID().encode('utf-8')] = a.getToNode().getID().encode('utf-8') #resulting states (arriving nodes)
-            self.__env[s.getID().encode('utf-8')] = d
+        #create MDP from the network's graph (in CSR format, see tools.graph), where:
+        #  * states are the nodes
+        #  * the actions available in each state are its out-links
+        #  * the resulting state of each action is the other end of the link
+        self.__graph = CSRGraph.from_sumo_net(self.__net)
+        
+        #lookup tables of the network's links, which are used instead of sumolib
+        #within the simulation's main loop (where sumolib's calls are too slow):
+        #  * __links is the set of links' IDs
+        #  * __links_nodes maps each link to its (FROM node, TO node) IDs
+        #  * __links_next maps each link to the tuple of links reachable from it
+        self.__links = frozenset(e.getID().encode('utf-8') for e in self.__net.getEdges())
+        self.__links_nodes = {}
+        self.__links_next = {}
+        for e in self.__net.getEdges():
+            ID = e.getID().encode('utf-8')
+            self.__links_nodes[ID] = (e.getFromNode().getID().encode('utf-8'), e.getToNode().getID().encode('utf-8'))
+            self.__links_next[ID] = tuple(x.getID().encode('utf-8') for x in e.getOutgoing())
         
 #         self.__env = {}
 #         for s in self.__net.getNodes(): #current states (current nodes)
@@ -90,39 +114,14 @@ class SUMO(Environment):
         # is recreated on each episode
         self.__vehicles = {}
         
-        #process all route entries
-        R = {}
-        routes_parse = minidom.parse(self.__rou_file).getElementsByTagName('route')
-        for route in routes_parse:
-            if route.hasAttribute('id'):
-                R[route.getAttribute('id').encode('utf-8')] = route.getAttribute('edges').encode('utf-8')
-        
-        # process all vehicle entries
-        vehicles_parse = minidom.parse(self.__rou_file).getElementsByTagName('vehicle')
-        for v in vehicles_parse:
-            
-            #vehicle's ID
-            vehID = v.getAttribute('id').encode('utf-8')
-            
-            # process the vehicle's route
-            route = ''
-            if v.hasAttribute('route'): # list of edges or route ID
-                route = v.getAttribute('route').encode('utf-8')
-                if route in R: # route ID
-                    route = R[route]
-            else: # child route tag
-                route = v.getElementsByTagName('route')[0].getAttribute('edges').encode('utf-8')
+        # process all vehicle entries (the route file is read in a single pass,
+        # see tools/sumoxml.py)
+        for vehID, route, depart, vType in sumoxml.read_vehicles(self.__rou_file):
             
             # origin and destination nodes
             origin = self.__get_edge_origin(route.split(' ')[0])
             destination = self.__get_edge_destination(route.split(' ')[-1])
             
-            #depart
-            depart = v.getAttribute('depart').encode('utf-8')
-            
-            #vType 
-            vType = v.getAttribute('vType').encode('utf-8')
-            
             # create the entry in the dictionary 
             self.__vehicles[vehID] = {
                 'origin': origin,
@@ -153,11 +152,11 @@ class SUMO(Environment):
     
     def __get_edge_origin(self, edge_id):
         # return the FROM node ID of the edge edge_id
-        return self.__net.getEdge(edge_id).getFromNode().getID().encode('utf-8')
+        return self.__links_nodes[edge_id][0]
     
     def __get_edge_destination(self, edge_id):
         # return the TO node ID of the edge edge_id
-        return self.__net.getEdge(edge_id).getToNode().getID().encode('utf-8')
+        return self.__links_nodes[edge_id][1]
     
     #return an Edge instance from its ID
     def __get_action(self, ID):
@@ -169,18 +168,35 @@ class SUMO(Environment):
     
     #commands to be performed upon normal termination
     def __close_connection(self):
-        traci.close()               #stop TraCI
+        if not self.__reuse_sumo:
+            self.close()            #stop TraCI
         sys.stdout.flush()          #clear standard output
     
+    #stop SUMO (when SUMO is reused along the episodes, this must be called
+    #once all episodes are done)
+    def close(self):
+        if self.__sumo_running:
+            sumobackend.close(self._backend, self.__label)
+            self.__sumo_running = False
+    
     def get_state_actions(self, state):
-        return self.__env[state].keys()
+        return self.__graph.out_edge_names(state)
+    
+    # return the network's graph (in CSR format, see tools.graph)
+    def get_graph(self):
+        return self.__graph
     
     def reset_episode(self):
         
         super(SUMO, self).reset_episode()
         
-        #initialise TraCI
-        traci.start([self._sumo_binary , "-c", self.__cfg_file]) # SUMO 0.28
+        #initialise TraCI (or reload the simulation if SUMO is reused, in which
+        #case all vehicles and routes, including the R-<vehID> ones, are dropped)
+        if self.__sumo_running:
+            self._traci.load(["-c", self.__cfg_file])
+        else:
+            self._traci = sumobackend.start(self._backend, [self._sumo_binary , "-c", self.__cfg_file], self.__port, self.__label) # SUMO 0.28
+            self.__sumo_running = True
         
         
         #------------------------------------
@@ -194,13 +210,32 @@ class SUMO(Environment):
             self.__vehicles[vehID]['route'] = [self.__vehicles[vehID]['origin']]
             self.__vehicles[vehID]['initialized'] = False
             self.__vehicles[vehID]['n_of_traversed_links'] = 0
+            self.__vehicles[vehID]['route_links'] = []
+        
+        # set of vehicles currently in the network (i.e., those that have
+        # departed but not yet arrived), updated as vehicles depart and arrive
+        self.__active_vehicles = set()
+        
+        # number of TraCI calls made in each simulation step (see get_traci_calls())
+        self.__traci_calls = 0
+        self.__traci_calls_per_step = []
+        
+        # number of decisions and time spent on them in each simulation step
+        # (see get_decision_latency())
+        self.__decision_latency_per_step = []
     
+    # suppress the standard output within a with statement (the output
+    # is restored, and the null device is closed, even upon exceptions)
     @contextmanager
     def redirected(self):
         saved_stdout = sys.stdout
-        sys.stdout = open(os.devnull, 'wb')
-        yield
-        sys.stdout = saved_stdout
+        devnull = open(os.devnull, 'wb')
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = saved_stdout
+            devnull.close()
     
     def run_episode(self, max_steps=-1):
         
@@ -216,19 +251,10 @@ class SUMO(Environment):
         #----------------------------------------------------------------------------------
         # the initial action must be known in advance in order to create the vehicle's 
         # initial route (vehicles need a route to be created)
-        learner_state_action = {}
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act1()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act2()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act3()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act4()
-        for vehID in self.get_vehicles_ID_list():
-            # let the learner choose the first action
-            state, action = self._learners[vehID].act_last()
-            learner_state_action[vehID] = [state, action]
+        # act1-act4 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(ACT_PHASES, self.get_vehicles_ID_list())
+        # let the learners choose the first action (in batches, see Environment.act_last_batch)
+        learner_state_action = self.act_last_batch(self.get_vehicles_ID_list())
          
         #for vehID in learner_state_action.keys():
         #    self._learners[vehID].feedback1(0.0, learner_state_action[vehID][0])
@@ -241,15 +267,22 @@ class SUMO(Environment):
             #self._learners[vehID].feedback_last(0.0, learner_state_action[vehID][0])
             
             # create an initial route for vehicle vehID, consisting of the first action, only
-            traci.route.add('R-%s'%vehID, [learner_state_action[vehID][1]])
+            self._traci.route.add('R-%s'%vehID, [learner_state_action[vehID][1]])
+            self.__vehicles[vehID]['route_links'] = [learner_state_action[vehID][1]]
             #print vehID, [learner_state_action[vehID][1]]
-            with (self.redirected()):
+        
+        # assign the initial routes to the vehicles already loaded by SUMO (those
+        # not yet loaded have it assigned as soon as they are loaded, in the main
+        # loop; setting their route here fails, and the errors printed by TraCI
+        # are suppressed, within a single scope for all vehicles)
+        with self.redirected():
+            for vehID in learner_state_action.keys():
                 try:
                     #print '***  **',vehID, 'R-%s'%vehID, traci.vehicle.getRoute(vehID),'\n'
-                    traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
+                    self._traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
                     self.__vehicles[vehID]['initialized'] = True
                     #print vehID , ': ' , 'R-%s'%vehID , ' = ' , traci.route.getEdges('R-%s'%vehID )
-                except:
+                except Exception:
                     pass
         #----------------------------------------------------------------------------------
         
@@ -259,39 +292,53 @@ class SUMO(Environment):
         arrived=0
         departed=0
         
-        while ((max_steps > -1 and traci.simulation.getCurrentTime() < max_steps) or max_steps <= -1) and (traci.simulation.getMinExpectedNumber() > 0 or traci.simulation.getArrivedNumber() > 0):
+        while self.__keep_running(max_steps):
             
             #if (traci.simulation.getCurrentTime()/1000) % 100 == 0:
             #    print traci.simulation.getCurrentTime()/1000
             
             # loaded vehicles
             # the initial route must be set as soon as the vehicle is loaded, and BEFORE it enters the network
-            for vehID in traci.simulation.getLoadedIDList():
-                traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
+            loaded = self._traci.simulation.getLoadedIDList()
+            for vehID in loaded:
+                self._traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
                 self.__vehicles[vehID]['initialized'] = True
                 #if vehID == vtest:
                 #    print "Route of %s was %s now is %s" % (vehID, rrraaab, traci.vehicle.getRoute(vehID))
+            self.__traci_calls += 1 + len(loaded)
             
             # run a single simulation step 
-            traci.simulationStep()
-            current_time = traci.simulation.getCurrentTime()/1000
+            self._traci.simulationStep()
+            current_time = self._traci.simulation.getCurrentTime()/1000
+            self.__traci_calls += 2
 
             #if current_time % 500 == 0:
             #    print '> %i, %i (%i departed, %i arrived) ' % (self._episodes, current_time, departed, arrived)
             
             # departed vehicles (those that have are entering the network)
-            for vehID in traci.simulation.getDepartedIDList():
+            # (their current road is subscribed, so that it is received
+            # in bulk at each step, rather than queried one by one;
+            # subscriptions end automatically when vehicles leave the network)
+            self.__traci_calls += 1
+            for vehID in self._traci.simulation.getDepartedIDList():
                 self.__vehicles[vehID]["departure_time"] = current_time
                 departed += 1
+                self.__active_vehicles.add(vehID)
                 
                 if not self.__vehicles[vehID]['initialized']:
-					traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
+					self._traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
 					self.__vehicles[vehID]['initialized'] = True
+					self.__traci_calls += 1
+                
+                self._traci.vehicle.subscribe(vehID, [traci.constants.VAR_ROAD_ID])
+                self.__traci_calls += 1
             
             # arrived vehicles (those that have reached their destinations)
             vehicles_to_process_feedback = {}
-            for vehID in traci.simulation.getArrivedIDList():
+            self.__traci_calls += 1
+            for vehID in self._traci.simulation.getArrivedIDList():
                 arrived += 1
+                self.__active_vehicles.discard(vehID)
                 
                 self.__vehicles[vehID]["arrival_time"] = current_time
                 self.__vehicles[vehID]["travel_time"] = self.__vehicles[vehID]["arrival_time"] - self.__vehicles[vehID]["departure_time"]
@@ -311,11 +358,16 @@ class SUMO(Environment):
             vehicles_to_process_feedback = {}
             vehicles_to_process_act = {}
             
-            for vehID in self.get_vehicles_ID_list(): # all vehicles
-                if self.__vehicles[vehID]["departure_time"] != -1.0 and self.__vehicles[vehID]["arrival_time"] == -1.0: # who have departed but not yet arrived
-                    road = traci.vehicle.getRoadID(vehID)
+            # the subscribed variables of all vehicles in the network (the
+            # subscription results are received along with the simulation step,
+            # so no further calls are needed)
+            subscription_results = sumobackend.all_subscription_results(self._traci.vehicle)
+            
+            for vehID in self.__active_vehicles: # vehicles who have departed but not yet arrived
+                if self.__vehicles[vehID]["arrival_time"] == -1.0: # (and were not removed in the meantime)
+                    road = subscription_results[vehID][traci.constants.VAR_ROAD_ID]
                     #print '%s: is in %s (%s in table), which is %s' % (vehID, road, self.__vehicles[vehID]["current_link"], self.__is_link(road))
-                    if road != self.__vehicles[vehID]["current_link"] and self.__is_link(road): #but have just leaved a node
+                    if road != self.__vehicles[vehID]["current_link"] and road in self.__links: #but have just leaved a node
                         #update info of previous link
                         if self.__vehicles[vehID]['time_last_link'] > -1.0:
                             
@@ -337,19 +389,25 @@ class SUMO(Environment):
                         self.__vehicles[vehID]['n_of_traversed_links'] += 1
                         
                         #get the next node, and add it to the route
-                        node = self.__get_edge_destination(self.__vehicles[vehID]["current_link"])
-                        self.__vehicles[vehID]['route'].append(self.__get_edge_destination(self.__vehicles[vehID]['current_link']))
+                        node = self.__links_nodes[road][1]
+                        self.__vehicles[vehID]['route'].append(node)
                         
                         if node != self.__vehicles[vehID]['destination']:
                             vehicles_to_process_act[vehID] = [
                                 node, #next state
-                                [x.getID().encode('utf-8') for x in self.__net.getEdge(self.__vehicles[vehID]['current_link']).getOutgoing()] #available actions
+                                self.__links_next[road] #available actions
                             ]
             
             self.__process_vehicles_feedback(vehicles_to_process_feedback, current_time)
+            
+            decision_start = time.time()
             self.__process_vehicles_act(vehicles_to_process_act, current_time)
+            self.__decision_latency_per_step.append([len(vehicles_to_process_act), time.time() - decision_start])
                             
             #=======================================================================
+            
+            self.__traci_calls_per_step.append(self.__traci_calls)
+            self.__traci_calls = 0
         
         #for v in self.__vehicles.keys():
         #    print '%s: %s' % (v, self.__vehicles[v])
@@ -367,74 +425,82 @@ class SUMO(Environment):
     
     def __process_vehicles_feedback(self, vehicles, current_time):
         
-        # feedback1
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback1(vehicles[vehID][0], vehicles[vehID][1], vehicles[vehID][2], vehicles[vehID][3])
-        
-        # feedback2
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback2(vehicles[vehID][0], vehicles[vehID][1], vehicles[vehID][2], vehicles[vehID][3])
+        names = vehicles.keys()
+        args = [[vehicles[vehID][k] for vehID in names] for k in range(4)]
         
-        # feedback3
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback3(vehicles[vehID][0], vehicles[vehID][1], vehicles[vehID][2], vehicles[vehID][3])
+        # feedback1-feedback3 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(FEEDBACK_PHASES, names, *args)
         
-        # feedback_last
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback_last(vehicles[vehID][0], vehicles[vehID][1], vehicles[vehID][2], vehicles[vehID][3])
+        # feedback_last (in batches, see Environment.feedback_last_batch)
+        self.feedback_last_batch(names, *args)
             
     def __process_vehicles_act(self, vehicles, current_time):
         
-        # act1
-        for vehID in vehicles.keys():
-            self._learners[vehID].act1(vehicles[vehID][0], vehicles[vehID][1])
+        names = vehicles.keys()
+        args = [[vehicles[vehID][k] for vehID in names] for k in range(2)]
         
-        # act2
-        for vehID in vehicles.keys():
-            self._learners[vehID].act2(vehicles[vehID][0], vehicles[vehID][1])
-        
-        # act3
-        for vehID in vehicles.keys():
-            self._learners[vehID].act3(vehicles[vehID][0], vehicles[vehID][1])
-        
-        # act4
-        for vehID in vehicles.keys():
-            self._learners[vehID].act4(vehicles[vehID][0], vehicles[vehID][1])
+        # act1-act4 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(ACT_PHASES, names, *args)
             
-        # act_last
-        for vehID in vehicles.keys():
+        # act_last (in batches, see Environment.act_last_batch)
+        state_action = self.act_last_batch(names, *args)
+        for vehID in names:
             #~ print vehID,  vehicles[vehID][1]
-            _, action = self._learners[vehID].act_last(vehicles[vehID][0], vehicles[vehID][1])
+            _, action = state_action[vehID]
             #~ print vehID, action
             #print "%s is in state %s and chosen action %s among %s" % (vehID, vehicles[vehID][0], action, vehicles[vehID][1])
             
             if not vehicles[vehID][1]:
-                traci.vehicle.remove(vehID, traci.constants.REMOVE_ARRIVED)
+                self._traci.vehicle.remove(vehID, traci.constants.REMOVE_ARRIVED)
+                self.__traci_calls += 1
+                self.__active_vehicles.discard(vehID)
                 self.__vehicles[vehID]["arrival_time"] = current_time
                 self.__vehicles[vehID]["travel_time"] = self.__vehicles[vehID]["arrival_time"] - self.__vehicles[vehID]["departure_time"]
                 continue
             
             #update route
-            cur_route = traci.vehicle.getRoute(vehID)
-            #~ print 'route', traci.route.getEdges('R-%s'%vehID)
-            #~ print vehID, traci.vehicle.getRoute(vehID)
-            cur_route.append(action)
+            #(the route is mirrored in route_links, so it needs not to be
+            #retrieved from SUMO; as SUMO keeps the traversed links in the
+            #route when it is replaced, the mirror also keeps them)
+            self.__vehicles[vehID]['route_links'].append(action)
             #~ print 'current ', vehID, self.__vehicles[vehID]['current_link']
             
             # remove traversed links from the route
             # (this is necessary because otherwise the driver will try 
-            # to reach the first link of such route from its current link)
-            cur_route = cur_route[self.__vehicles[vehID]['n_of_traversed_links']-1:]
+            # to reach the first link of such route from its current link),
+            # such that only the current link and the chosen one are sent
+            cur_route = self.__vehicles[vehID]['route_links'][self.__vehicles[vehID]['n_of_traversed_links']-1:]
             
             #~ print vehID, cur_route
-            traci.vehicle.setRoute(vehID, cur_route)
+            self._traci.vehicle.setRoute(vehID, cur_route)
+            self.__traci_calls += 1
+    
+    # check whether the simulation must keep running (ie, the condition of the 
+    # main loop of run_episode), counting the TraCI calls it makes
+    def __keep_running(self, max_steps):
+        if max_steps > -1:
+            self.__traci_calls += 1
+            if self._traci.simulation.getCurrentTime() >= max_steps:
+                return False
+        self.__traci_calls += 1
+        if self._traci.simulation.getMinExpectedNumber() > 0:
+            return True
+        self.__traci_calls += 1
+        return self._traci.simulation.getArrivedNumber() > 0
+    
+    # return the number of TraCI calls made in each step of the last episode
+    # (a list with one position per simulation step)
+    def get_traci_calls(self):
+        return self.__traci_calls_per_step
+    
+    # return the decision latency in each step of the last episode, as a list
+    # with one position per simulation step in the form [number of decisions,
+    # time (in seconds) spent on them, including the route updates]
+    def get_decision_latency(self):
+        return self.__decision_latency_per_step
     
     def __is_link(self, edge_id):
-        try:
-            _ = self.__net.getEdge(edge_id)
-            return True
-        except:
-            return False
+        return edge_id in self.__links
     
     def run_step(self):
         raise Exception('run_step is not available in %s class' % self)
@@ -449,11 +515,11 @@ class SUMO(Environment):
             
 class SUMORouteChoice(Environment):
     
-    def __init__(self, cfg_file, port=8813, use_gui=False):
+    def __init__(self, cfg_file, port=8813, use_gui=False, use_libsumo=False, reuse_sumo=False):
         
         super(SUMORouteChoice, self).__init__()
         
-        self.__create_env(cfg_file, port, use_gui)
+        self.__create_env(cfg_file, port, use_gui, use_libsumo, reuse_sumo)
         
     '''
     Create the environment as a MDP. The MDP is modeled as follows:
@@ -462,7 +528,7 @@ class SUMORouteChoice(Environment):
     * the reward of taking an action a (route) is the travel time multiplied by -1 (the lower the travel time the better)
     * the transitions between states are deterministic
     '''
-    def __create_env(self, cfg_file, port, use_gui):
+    def __create_env(self, cfg_file, port, use_gui, use_libsumo, reuse_sumo):
         
         #check for SUMO's binaries
         if use_gui:
@@ -470,15 +536,31 @@ class SUMORouteChoice(Environment):
         else:
             self._sumo_binary = sumolib.checkBinary('sumo')
         
+        # the backend used to drive the simulation: libsumo (in-process), if
+        # requested and installed, or TraCI otherwise (see tools/sumobackend.py);
+        # the simulation is driven through _traci, which is the connection to
+        # SUMO (labelled by port, so that several environments can run at once)
+        self._backend = sumobackend.get_backend(use_libsumo, use_gui)
+        self._traci = self._backend
+        self.__label = 'port-%i' % port
+        
+        # whether the same SUMO instance is used along all episodes (in which
+        # case the simulation is reloaded at the beginning of each episode,
+        # rather than starting a new SUMO process; see close())
+        self.__reuse_sumo = reuse_sumo
+        self.__sumo_running = False
+        
         #register SUMO/TraCI parameters
         self.__cfg_file = cfg_file
-        self.__net_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + minidom.parse(self.__cfg_file).getElementsByTagName('net-file')[0].attributes['value'].value
-        self.__rou_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + minidom.parse(self.__cfg_file).getElementsByTagName('route-files')[0].attributes['value'].value
+        self.__net_file, self.__rou_file = sumoxml.read_cfg_files(self.__cfg_file)
         self.__port = port
         
         #read the network file
         self.__net = sumolib.net.readNet(self.__net_file)
         
+        # the network's graph (in CSR format, see tools.graph)
+        self.__graph = CSRGraph.from_sumo_net(self.__net)
+        
         # create MDP as a dictionary, where:
         #   * keys represent the nodes' IDs (current state)
         #   * the value of each key is another dictionary, where:
@@ -515,6 +597,17 @@ class SUMORouteChoice(Environment):
         # for each route an entry <s', a> is created (s'=resulting state, a=routes)
         for r in routes:
             self.__env[key][2].append(r)
+    
+    # define the set of routes of each OD-pair as its K shortest paths, computed
+    # with the KSP algorithm over the given network file (in the KSP format, see 
+    # tools.misc.convert_SUMO_to_KSP); the routes are stored in a cache file 
+    # (see KSP.getKRoutesODListCached), so that they are computed only once for
+    # the same network file and K
+    def set_routes_KSP(self, ksp_file, K, cache_file=None, processes=1):
+        pairs = self.get_OD_pairs()
+        for (origin, destination), RKSP in zip(pairs, KSP.getKRoutesODListCached(ksp_file, pairs, K, cache_file, processes)):
+            routes = [" ".join(r[0]) for r in RKSP]
+            self.set_routes_OD_pair(origin, destination, routes)
         
     # create the set of vehicles and the OD-matrix
     def __create_vehicles(self):
@@ -531,28 +624,9 @@ class SUMORouteChoice(Environment):
         # the latter correspond to the number of vehicles in that OD-pair
         self.__OD_matrix = {}
         
-        #process all route entries
-        R = {}
-        routes_parse = minidom.parse(self.__rou_file).getElementsByTagName('route')
-        for route in routes_parse:
-            if route.hasAttribute('id'):
-                R[route.getAttribute('id').encode('utf-8')] = route.getAttribute('edges').encode('utf-8')
-        
-        # process all vehicle entries
-        vehicles_parse = minidom.parse(self.__rou_file).getElementsByTagName('vehicle')
-        for v in vehicles_parse:
-            
-            #vehicle's ID
-            vehID = v.getAttribute('id').encode('utf-8')
-            
-            # process the vehicle's route
-            route = ''
-            if v.hasAttribute('route'): # list of edges or route ID
-                route = v.getAttribute('route').encode('utf-8')
-                if route in R: # route ID
-                    route = R[route]
-            else: # child route tag
-                route = v.getElementsByTagName('route')[0].getAttribute('edges').encode('utf-8')
+        # process all vehicle entries (the route file is read in a single pass,
+        # see tools/sumoxml.py)
+        for vehID, route, depart, vType in sumoxml.read_vehicles(self.__rou_file):
             
             # origin and destination nodes
             origin = self.__get_edge_origin(route.split(' ')[0])
@@ -611,19 +685,37 @@ class SUMORouteChoice(Environment):
     
     # commands to be performed upon normal termination
     def __close_connection(self):
-        traci.close()               # stop TraCI
+        if not self.__reuse_sumo:
+            self.close()            # stop TraCI
         sys.stdout.flush()          # clear standard output
+    
+    # stop SUMO (when SUMO is reused along the episodes, this must be called
+    # once all episodes are done)
+    def close(self):
+        if self.__sumo_running:
+            sumobackend.close(self._backend, self.__label)
+            self.__sumo_running = False
         
     def get_state_actions(self, state):
         self.__check_env()
         return self.__env[state][2]
     
+    # return the network's graph (in CSR format, see tools.graph), which
+    # can be used, eg, to compute routes (see KSP.graphFromCSR)
+    def get_graph(self):
+        return self.__graph
+    
     def reset_episode(self):
         
         super(SUMORouteChoice, self).reset_episode()
         
-        # initialise TraCI
-        traci.start([self._sumo_binary , "-c", self.__cfg_file]) # SUMO 0.28
+        # initialise TraCI (or reload the simulation if SUMO is reused, in which
+        # case all vehicles and routes, including the R-<vehID> ones, are dropped)
+        if self.__sumo_running:
+            self._traci.load(["-c", self.__cfg_file])
+        else:
+            self._traci = sumobackend.start(self._backend, [self._sumo_binary , "-c", self.__cfg_file], self.__port, self.__label) # SUMO 0.28
+            self.__sumo_running = True
         
         # reset vehicles attributes
         for vehID in self.get_vehicles_ID_list():
@@ -631,12 +723,18 @@ class SUMORouteChoice(Environment):
             self.__vehicles[vehID]['arrival_time'] = -1.0
             self.__vehicles[vehID]['travel_time'] = -1.0
     
+    # suppress the standard output within a with statement (the output
+    # is restored, and the null device is closed, even upon exceptions)
     @contextmanager
     def redirected(self):
         saved_stdout = sys.stdout
-        sys.stdout = open(os.devnull, 'wb')
-        yield
-        sys.stdout = saved_stdout
+        devnull = open(os.devnull, 'wb')
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = saved_stdout
+            devnull.close()
     
     # check whether the environment is ready to run
     def __check_env(self):
@@ -658,19 +756,10 @@ class SUMORouteChoice(Environment):
         #----------------------------------------------------------------------------------
         # the initial action must be known in advance in order to create the vehicle's 
         # initial route (vehicles need a route to be created)
-        learner_state_action = {}
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act1()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act2()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act3()
-        for vehID in self.get_vehicles_ID_list():
-            self._learners[vehID].act4()
-        for vehID in self.get_vehicles_ID_list():
-            # let the learner choose the first action
-            state, action = self._learners[vehID].act_last()
-            learner_state_action[vehID] = [state, action]
+        # act1-act4 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(ACT_PHASES, self.get_vehicles_ID_list())
+        # let the learners choose the first action (in batches, see Environment.act_last_batch)
+        learner_state_action = self.act_last_batch(self.get_vehicles_ID_list())
          
         #for vehID in learner_state_action.keys():
         #    self._learners[vehID].feedback1(0.0, learner_state_action[vehID][0])
@@ -683,33 +772,39 @@ class SUMORouteChoice(Environment):
             #self._learners[vehID].feedback_last(0.0, learner_state_action[vehID][0])
               
             # create an initial route for vehicle vehID, consisting of the first action, only
-            traci.route.add('R-%s'%vehID, learner_state_action[vehID][1].split(' '))
-            with (self.redirected()):
+            self._traci.route.add('R-%s'%vehID, learner_state_action[vehID][1].split(' '))
+        
+        # assign the initial routes to the vehicles already loaded by SUMO (those
+        # not yet loaded have it assigned as soon as they are loaded, in the main
+        # loop; setting their route here fails, and the errors printed by TraCI
+        # are suppressed, within a single scope for all vehicles)
+        with self.redirected():
+            for vehID in learner_state_action.keys():
                 try:
-                    traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
-                except:
+                    self._traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
+                except Exception:
                     pass
         #----------------------------------------------------------------------------------
         
         # main loop
-        while ((max_steps > -1 and traci.simulation.getCurrentTime() < max_steps) or max_steps <= -1) and (traci.simulation.getMinExpectedNumber() > 0 or traci.simulation.getArrivedNumber() > 0):
+        while ((max_steps > -1 and self._traci.simulation.getCurrentTime() < max_steps) or max_steps <= -1) and (self._traci.simulation.getMinExpectedNumber() > 0 or self._traci.simulation.getArrivedNumber() > 0):
             
             # loaded vehicles
             # the initial route must be set as soon as the vehicle is loaded, and BEFORE it enters the network
-            for vehID in traci.simulation.getLoadedIDList():
-                traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
+            for vehID in self._traci.simulation.getLoadedIDList():
+                self._traci.vehicle.setRouteID(vehID, 'R-%s'%vehID)
             
             # run a single simulation step 
-            traci.simulationStep()
-            current_time = traci.simulation.getCurrentTime()/1000
+            self._traci.simulationStep()
+            current_time = self._traci.simulation.getCurrentTime()/1000
             
             # departed vehicles (those that have are entering the network)
-            for vehID in traci.simulation.getDepartedIDList():
+            for vehID in self._traci.simulation.getDepartedIDList():
                 self.__vehicles[vehID]["departure_time"] = current_time
             
             # arrived vehicles (those that have reached their destinations)
             vehicles_to_process_feedback = {}
-            for vehID in traci.simulation.getArrivedIDList():
+            for vehID in self._traci.simulation.getArrivedIDList():
                 self.__vehicles[vehID]["arrival_time"] = current_time
                 self.__vehicles[vehID]["travel_time"] = self.__vehicles[vehID]["arrival_time"] - self.__vehicles[vehID]["departure_time"]
                 
@@ -733,21 +828,14 @@ class SUMORouteChoice(Environment):
         
     def __process_vehicles_feedback(self, vehicles, current_time):
         
-        # feedback1
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback1(vehicles[vehID][0], vehicles[vehID][1])
-        
-        # feedback2
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback2(vehicles[vehID][0], vehicles[vehID][1])
+        names = vehicles.keys()
+        args = [[vehicles[vehID][k] for vehID in names] for k in range(2)]
         
-        # feedback3
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback3(vehicles[vehID][0], vehicles[vehID][1])
+        # feedback1-feedback3 (only on the learners that use them, see Environment.run_phases)
+        self.run_phases(FEEDBACK_PHASES, names, *args)
         
-        # feedback_last
-        for vehID in vehicles.keys():
-            self._learners[vehID].feedback_last(vehicles[vehID][0], vehicles[vehID][1])
+        # feedback_last (in batches, see Environment.feedback_last_batch)
+        self.feedback_last_batch(names, *args)
     
     def __is_link(self, edge_id):
         try:
@@ -6,8 +6,9 @@ Created on 12/12/2017
 
 from environment import Environment
 import traci
+from tools import sumobackend
 import sumolib
-from xml.dom import minidom
+from tools import sumoxml
 import sys, os
 import subprocess
 import atexit
@@ -22,11 +23,11 @@ import math
 
 class SUMOTrafficLights(Environment):
     
-    def __init__(self, cfg_file, port=8813, use_gui=False):
+    def __init__(self, cfg_file, port=8813, use_gui=False, use_libsumo=False, reuse_sumo=False):
         
         super(SUMOTrafficLights, self).__init__()
         
-        self.__create_env(cfg_file, port, use_gui)
+        self.__create_env(cfg_file, port, use_gui, use_libsumo, reuse_sumo)
         
     
     '''
@@ -37,13 +38,13 @@ class SUMOTrafficLights(Environment):
     * and, the queue length is calculated according to the occupation of the link. 
     * The occupation is discretized in 4 intervals (equally distributed)
     * The number of ACTIONS is equal to the number of phases
-    * Currentlly, there are only two phases thus the actions are either keep green time at the current phase or 
-    * allow green to another phase. As usual, we call these actions 'keep' and 'change'
+    * The phases (and the lanes approaching each of them) are taken from the network file, and the actions are either
+    * keep green time at the current phase or allow green to the next phase. As usual, we call these actions 'keep' and 'change'
     * At each junction, REWARD is defined as the difference between the current and the previous average queue length (AQL)
     * at the approaching lanes, i.e., for each traffic light the reward  is defined as $R(s,a,s')= AQL_{s} - AQL_{s'}$.
     * the transitions between states are deterministic
     '''        
-    def __create_env(self, cfg_file, port, use_gui):
+    def __create_env(self, cfg_file, port, use_gui, use_libsumo, reuse_sumo):
         
         #check for SUMO's binaries
         if use_gui:
@@ -51,13 +52,35 @@ class SUMOTrafficLights(Environment):
         else:
             self._sumo_binary = sumolib.checkBinary('sumo')
         
+        #the backend used to drive the simulation: libsumo (in-process), if
+        #requested and installed, or TraCI otherwise (see tools/sumobackend.py);
+        #the simulation is driven through _traci, which is the connection to
+        #SUMO (labelled by port, so that several environments can run at once)
+        self._backend = sumobackend.get_backend(use_libsumo, use_gui)
+        self._traci = self._backend
+        self._traci_tls = sumobackend.trafficlight_domain(self._traci)
+        self.__port = port
+        self.__label = 'port-%i' % port
+        
+        #whether the same SUMO instance is used along all episodes (in which
+        #case the simulation is reloaded at the beginning of each episode,
+        #rather than starting a new SUMO process; see close())
+        self.__reuse_sumo = reuse_sumo
+        self.__sumo_running = False
+        
         #register SUMO/TraCI parameters
         self.__cfg_file = cfg_file
-        self.__net_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + minidom.parse(self.__cfg_file).getElementsByTagName('net-file')[0].attributes['value'].value
+        self.__net_file = self.__cfg_file[:self.__cfg_file.rfind("/")+1] + sumoxml.read_cfg(self.__cfg_file)['net-file']
 
         
-        #read the network file
-        self.__net = sumolib.net.readNet(self.__net_file)
+        #read the traffic lights (their programs and controlled lanes) and the
+        #lanes' lengths from the network file, in a single pass (see tools/sumoxml.py)
+        tls, lengths = sumoxml.read_net_tls(self.__net_file)
+        
+        #create the set of traffic ligths
+        self.__create_trafficlights(tls)
+        
+        self.__create_edges(tls, lengths)
         
         self.__env = {}
         
@@ -66,136 +89,157 @@ class SUMOTrafficLights(Environment):
         # d[1] = 'change'
         
         # to each state the actions are the same
-        # self.__env[state] has 160 possible variations
-        # [idPhase, elapsed time, queue NS, queue EW] = [2, 5, 4, 4]
-        # 2 * 5 * 4 * 4 = 160
-        # idPhase: 2 phases - NS, EW
+        # [idPhase, elapsed time, queue of each green phase], e.g. [2, 5, 4, 4]
+        # for two green phases (NS, EW), which gives 2 * 5 * 4 * 4 = 160 states
+        # idPhase: the green phases of the traffic light (see __create_edges)
         # elapsed time: 30s that are discretize in 5 intervals
         # queue: 0 to 100% discretize in 4 intervals
-        # Note: to change the number of phases, it is necessary to change the number of states, e.g. 3 phases: [3, 5, 4, 4, 4]
-        # it is also necessary to change the method change_trafficlight
-        for x in range(0, 160): 
+        # the number of states is that of the traffic light with more green phases
+        n_states = int(max([np.prod(self.__state_factors(len(green))) for green in self.__tls_green]))
+        for x in range(0, n_states): 
 			self.__env[x] = d
-                    
-        #create the set of traffic ligths
-        self.__create_trafficlights()
-        
-        self.__create_edges()
                                          
       
-    def __create_trafficlights(self): 
+    def __create_trafficlights(self, tls): 
 		# set of all traffic lights in the simulation
         # each element in __trafficlights correspond to another in __learners
         self.__trafficlights = {}
         
+        # the traffic lights' IDs (in the order they are defined in the network
+        # file), which is also the order of the traffic lights in the arrays
+        # created in __create_edges and run_episode; __tls_index[tlID] is the
+        # position of the traffic light in such arrays
+        self.__tls_ID = []
+        self.__tls_index = {}
+        
         # process all trafficlights entries
-        junctions_parse = minidom.parse(self.__net_file).getElementsByTagName('junction')
-        for element in junctions_parse:
-	    if element.getAttribute('type') == "traffic_light":
-		    tlID = element.getAttribute('id').encode('utf-8')
-		    
-		    # create the entry in the dictionary 
-		    self.__trafficlights[tlID] = {
-			    'greenTime': 0,
-			    'nextGreen': -1,
-			    'yellowTime': -1,
-			    'redTime': -1
-                } 
-                
+        for tlID, _, _ in tls:
+            self.__tls_index[tlID] = len(self.__tls_ID)
+            self.__tls_ID.append(tlID)
+            
+            # create the entry in the dictionary 
+            self.__trafficlights[tlID] = {
+                'yellowTime': -1,
+                'redTime': -1
+            } 
+            
     def reset_episode(self):
         
         super(SUMOTrafficLights, self).reset_episode()
  
-        # initialise TraCI
-        traci.start([self._sumo_binary , "-c", self.__cfg_file])
+        # initialise TraCI (or reload the simulation if SUMO is reused, in which
+        # case the traffic lights' programs are dropped and defined again in run_episode)
+        if self.__sumo_running:
+            self._traci.load(["-c", self.__cfg_file])
+        else:
+            self._traci = sumobackend.start(self._backend, [self._sumo_binary , "-c", self.__cfg_file], self.__port, self.__label)
+            self._traci_tls = sumobackend.trafficlight_domain(self._traci)
+            self.__sumo_running = True
         
-        # reset traffic lights attributes
+        # reset traffic lights attributes (the green time and the next green
+        # phase are kept in arrays, indexed by the traffic lights' positions)
+        self.__green_time = np.zeros(len(self.__tls_ID), dtype=int)
+        self.__next_green = np.empty(len(self.__tls_ID), dtype=int)
+        self.__next_green.fill(-1)
         for tlID in self.get_trafficlights_ID_list():
-            self.__trafficlights[tlID]['greenTime'] = 0
-            self.__trafficlights[tlID]['nextGreen'] = -1
             self.__trafficlights[tlID]['yellowTime'] = -1
             self.__trafficlights[tlID]['redTime'] = -1
             
-    # define the edges/lanes that are controled for each traffic light
-    # the function getControlledLanes() from TRACI, returned the names of lanes doubled
-    # that's way is listed here
-    def __create_edges(self):
-        self._edgesNS = {}
-        self._edgesEW = {}        
-        
-        self._edgesNS[0] = ['0Ni_0', '0Ni_1', '0Si_0', '0Si_1']
-        self._edgesEW[0] = ['0Wi_0', '0Wi_1', '0Ei_0', '0Ei_1']
-        self._edgesNS[1] = ['1Ni_0', '1Ni_1', '1Si_0', '1Si_1']
-        self._edgesEW[1] = ['1Wi_0', '1Wi_1', '1Ei_0', '1Ei_1']
-        self._edgesNS[2] = ['2Ni_0', '2Ni_1', '2Si_0', '2Si_1']
-        self._edgesEW[2] = ['2Wi_0', '2Wi_1', '2Ei_0', '2Ei_1']
-        self._edgesNS[3] = ['3Ni_0', '3Ni_1', '3Si_0', '3Si_1']
-        self._edgesEW[3] = ['3Wi_0', '3Wi_1', '3Ei_0', '3Ei_1']
-        self._edgesNS[4] = ['4Ni_0', '4Ni_1', '4Si_0', '4Si_1']
-        self._edgesEW[4] = ['4Wi_0', '4Wi_1', '4Ei_0', '4Ei_1']
-        self._edgesNS[5] = ['5Ni_0', '5Ni_1', '5Si_0', '5Si_1']
-        self._edgesEW[5] = ['5Wi_0', '5Wi_1', '5Ei_0', '5Ei_1']
-        self._edgesNS[6] = ['6Ni_0', '6Ni_1', '6Si_0', '6Si_1']
-        self._edgesEW[6] = ['6Wi_0', '6Wi_1', '6Ei_0', '6Ei_1']
-        self._edgesNS[7] = ['7Ni_0', '7Ni_1', '7Si_0', '7Si_1']
-        self._edgesEW[7] = ['7Wi_0', '7Wi_1', '7Ei_0', '7Ei_1']
-        self._edgesNS[8] = ['8Ni_0', '8Ni_1', '8Si_0', '8Si_1']
-        self._edgesEW[8] = ['8Wi_0', '8Wi_1', '8Ei_0', '8Ei_1']
-
+    # define the lanes that are controled by each traffic light, grouped by the
+    # green phases of its program (NS and EW in the 3x3 grid), along with the
+    # capacity of each group; the green phases are those with some green link and
+    # no yellow link, and the lanes of a green phase are the incoming lanes of
+    # its green links (the connections' fromLane in the network file)
+    def __create_edges(self, tls, lengths):
+		# __tls_green[i] = [index of each green phase of the i-th traffic light]
+		# __tls_lanes[i][p] = [lanes of its p-th green phase]
+		# __tls_capacity[i, p] = capacity of such lanes (inf if there is no such phase)
+		# __tls_phases[i] = [[duration (ms), state] of each phase] (see __create_tlogic)
+		self.__tls_green = []
+		self.__tls_lanes = []
+		self.__tls_phases = []
+		capacity = []
+		for tlID, phases, links in tls:
+			green = [p for p, (_, s) in enumerate(phases) if ('G' in s or 'g' in s) and not ('Y' in s or 'y' in s)]
+			if not green:
+				raise Exception('Traffic light %s has no green phase!' % tlID)
+			
+			lanes = []
+			for p in green:
+				state = phases[p][1]
+				lanes.append(sorted(set([lane for l, lane in links.items() if state[l] in 'Gg'])))
+			
+			self.__tls_green.append(green)
+			self.__tls_lanes.append(lanes)
+			self.__tls_phases.append([[200000 if p in green else int(round(duration * 1000)), state] for p, (duration, state) in enumerate(phases)])
+			capacity.append([sum([lengths[lane] for lane in group]) / 7.5 for group in lanes]) # vehicle length 5m + 2.5m (minGap)
+		
+		self.__tls_capacity = np.empty((len(capacity), max([len(c) for c in capacity])))
+		self.__tls_capacity.fill(np.inf)
+		for i, c in enumerate(capacity):
+			self.__tls_capacity[i, :len(c)] = c
+		
+		# __tls_n_green[i] = number of green phases of the i-th traffic light
+		# __tls_green_pos[i, phase] = position of the phase among its green phases (-1 if not green)
+		self.__tls_n_green = np.array([len(green) for green in self.__tls_green])
+		self.__tls_green_pos = np.empty((len(self.__tls_phases), max([len(phases) for phases in self.__tls_phases])), dtype=int)
+		self.__tls_green_pos.fill(-1)
+		for i, green in enumerate(self.__tls_green):
+			self.__tls_green_pos[i, green] = range(len(green))
+		
+		# the controlled lanes (each one only once, even if controlled by several
+		# green phases), and the lane (__lanes_lane) and the green phase (__lanes_group,
+		# i * n + p, n being the number of columns of __tls_capacity) of each pair
+		# lane-green phase, so that the lanes' measures are summed by green phase
+		# at once (see __update_lanes_measures)
+		self.__lanes = sorted(set([lane for lanes in self.__tls_lanes for group in lanes for lane in group]))
+		index = dict([(lane, l) for l, lane in enumerate(self.__lanes)])
+		self.__lanes_lane = np.array([index[lane] for lanes in self.__tls_lanes for group in lanes for lane in group], dtype=int)
+		self.__lanes_group = np.array([i * self.__tls_capacity.shape[1] + p for i, lanes in enumerate(self.__tls_lanes) for p, group in enumerate(lanes) for _ in group], dtype=int)
+		
+		# the distinct pairs (traffic light, lane) of the controlled lanes (a lane
+		# green in several phases of a traffic light appears once), used to count
+		# the vehicles of each traffic light without repetitions (see metrics)
+		pairs = sorted(set([(i, index[lane]) for i, lanes in enumerate(self.__tls_lanes) for group in lanes for lane in group]))
+		self.__tl_lanes_tl = np.array([i for i, _ in pairs], dtype=int)
+		self.__tl_lanes_lane = np.array([l for _, l in pairs], dtype=int)
 	
-	# calculates the capacity for each queue of each traffic light
-    def __init_edges_capacity(self):
-        self._edgesNScapacity = {}
-        self._edgesEWcapacity = {}  
-                     
-        
-        for tlID in self.get_trafficlights_ID_list():
-			#~ print '----'
-			#~ print 'tlID', tlID
-			lengthNS = 0
-			lengthWE = 0
-			for lane in self._edgesNS[int(tlID)]:
-				lengthNS += traci.lane.getLength(lane)
-			for lane in self._edgesEW[int(tlID)]:
-				lengthWE += traci.lane.getLength(lane)
-			lengthNS = lengthNS/7.5 # vehicle length 5m + 2.5m (minGap)
-			lengthWE = lengthWE/7.5 
-			self._edgesNScapacity[int(tlID)] = lengthNS
-			self._edgesEWcapacity[int(tlID)] = lengthWE
-
-   
+	# the factors of the mixed radix encoding of the states of a traffic light
+	# with the given number of green phases (see mixed_radix_encode)
+    def __state_factors(self, n_phases):
+		return [n_phases, 5] + [4] * n_phases
 
 	# https://sourceforge.net/p/sumo/mailman/message/35824947/
 	# It's necessary set a new logic, because we need more duration time.
 	# in SUMO the duration of the phases are set in .net file. 
 	# but if in .net the phase duration is set to 30s and if we want 40s, the simulator will change phase in 30s
-	# thus, we set the duration with a high value
-	# also, the yellow and all red phase duration can be set here
-	# if prefer, this can be changed in .net file 'tllogic' tag
+	# thus, we set the duration of the green phases with a high value, while the
+	# yellow and all red phases keep the duration set in .net file 'tllogic' tag
+	# (see __create_edges)
 	# obs: the duration is set in ms
     def __create_tlogic(self):
-		phases = []
-		phases.append(traci._trafficlights.Phase(200000, 200000, 200000, "GGGgrrrrGGGgrrrr")) # N-S
-		phases.append(traci._trafficlights.Phase(2000, 2000, 2000, "YYYYrrrrYYYYrrrr"))
-		phases.append(traci._trafficlights.Phase(1000, 1000, 1000, "rrrrrrrrrrrrrrrr"))
-		phases.append(traci._trafficlights.Phase(200000, 200000,200000, "rrrrGGGgrrrrGGGg")) # E-W
-		phases.append(traci._trafficlights.Phase(2000, 2000, 2000, "rrrrYYYYrrrrYYYY"))
-		phases.append(traci._trafficlights.Phase(1000, 1000, 1000, "rrrrrrrrrrrrrrrr"))
-	
-		logic = traci._trafficlights.Logic("new-program", 0, 0, 0, phases)
-		for tlID in self.get_trafficlights_ID_list():
-			traci.trafficlights.setCompleteRedYellowGreenDefinition(tlID,logic)
+		for i, tlID in enumerate(self.__tls_ID):
+			logic = sumobackend.create_tl_logic(self._traci, "new-program", self.__tls_phases[i])
+			self._traci_tls.setCompleteRedYellowGreenDefinition(tlID,logic)
 		
 
     def get_trafficlights_ID_list(self):
         # return a list with the traffic lights' IDs
-        return self.__trafficlights.keys()
+        return self.__tls_ID
     
     # commands to be performed upon normal termination
     def __close_connection(self):
-        traci.close()               # stop TraCI
+        if not self.__reuse_sumo:
+            self.close()            # stop TraCI
         sys.stdout.flush()          # clear standard output
     
+    # stop SUMO (when SUMO is reused along the episodes, this must be called
+    # once all episodes are done)
+    def close(self):
+        if self.__sumo_running:
+            sumobackend.close(self._backend, self.__label)
+            self.__sumo_running = False
+    
     def get_state_actions(self, state):
         self.__check_env()
         # print state
@@ -209,163 +253,153 @@ class SUMOTrafficLights(Environment):
             raise Exception("The traffic lights must be set before running!")    
             
 	# discretize the queue occupation in 4 classes equally distributed
+	# (queue may be a single occupation or an array of them)
     def discretize_queue(self, queue): 
-		q_class = math.ceil((queue)/25)
-		if queue >= 75:
-			q_class = 3
-		
 		# percentage
-		#~ if queue < 25:
-			#~ q_class = 0 # 0 - 25%
-		#~ if queue >= 25 and queue < 50:
-			#~ q_class = 1 # 25 - 50%
-		#~ if queue >= 50 and queue < 75:
-			#~ q_class = 2 # 50 - 75%
-		#~ if queue >= 75:
-			#~ q_class = 3 # 75 - 100%
-			
-		return int(q_class)
+		# queue = 0 -> 0
+		# 0 < queue <= 25 -> 1
+		# 25 < queue <= 50 -> 2
+		# queue > 50 -> 3
+		return np.minimum(np.ceil(np.asarray(queue, dtype=float) / 25), 3).astype(int)
 
+	# discretize the elapsed time of the green phase (duration may be a single
+	# value or an array of them)
+	# the total elapsed time is 30s that are discretize in intervals
+	# discretize the duration time (elapsed time) in intervals of 5s (interv_action_selection), except the first interval
+	# the fisrt interval is 0 - minGreenTime (10s), and the last is > 25s
+    def discretize_duration(self, duration):
+		return np.clip(np.ceil((np.asarray(duration, dtype=float) - 10) / 5), 0, 4).astype(int)
         
     #http://stackoverflow.com/questions/759296/converting-a-decimal-to-a-mixed-radix-base-number
-    def mixed_radix_encode(self, idPhase, duration, queueNS, queueEW):		
-		factors = [2, 5, 4, 4]
+	# idPhase is the index of the current phase in the traffic light's program
+	# (e.g., idPhase = 0 (NS green), idPhase = 3 (EW green)) and queues are the
+	# occupations of the green phases' lanes, e.g. mixed_radix_encode(idPhase,
+	# duration, queueNS, queueEW); for the mixed radix conversion, idPhase is
+	# mapped to its position among the green phases (see __create_edges) of the
+	# traffic light given by the keyword argument tlID (by default, the first
+	# one, as the traffic lights usually share the same program)
+    def mixed_radix_encode(self, idPhase, duration, *queues, **kwargs):
+		i = self.__tls_index[kwargs['tlID']] if kwargs.get('tlID') is not None else 0
+		if idPhase not in self.__tls_green[i]:
+			raise Exception('Phase %s is not a green phase of traffic light %s!' % (idPhase, self.__tls_ID[i]))
+		position = self.__tls_green[i].index(idPhase)
+		return int(self.__mixed_radix_encode_all(np.array([position]), np.array([duration]), np.array([queues]), np.array([len(queues)]))[0])
+	
+	# encode the states of several traffic lights at once, where idPhase and
+	# duration are arrays (one position per traffic light), queues is a matrix
+	# (one row per traffic light, one column per green phase) and n_phases is
+	# the number of green phases of each traffic light (the columns beyond it
+	# are ignored); see mixed_radix_encode
+    def __mixed_radix_encode_all(self, idPhase, duration, queues, n_phases):
+		queues = self.discretize_queue(queues)
 		
-		queueNS = self.discretize_queue(queueNS)
-		queueEW = self.discretize_queue(queueEW)
-				
-		# the total elapsed time is 30s that are discretize in intervals
-		# discretize the duration time (elapsed time) in intervals of 5s (interv_action_selection), except the first interval
-		# the fisrt interval is 0 - minGreenTime
-		if duration > 0 and duration <= 10: # minGreenTime
-			duration = 0
-		if duration > 10 and duration <= 15:
-			duration = 1
-		if duration > 15 and duration <= 20:
-			duration = 2
-		if duration > 20 and duration <= 25:
-			duration = 3
-		if duration > 25:
-			duration = 4
-							
-		# idPhase = 0 (NS green), idPhase = 3 (EW green), 
-		# but for the mixed radix conversion idPhase can only assume 0 or 1
-		if idPhase == 3:
-			idPhase = 1
+		# mixed radix conversion, with factors [n_phases, 5, 4, ..., 4]
+		res = idPhase * 5 + self.discretize_duration(duration)
+		for p in range(queues.shape[1]):
+			res = np.where(p < n_phases, res * 4 + queues[:, p], res)
 			
-		# mixed radix conversion
-		values = [idPhase, duration, queueNS, queueEW]
-		res = 0
-		for i in range(4):
-			res = res * factors[i] + values[i]
-			
-		return res			 
+		return res
 		
 	# decode a mixed radix conversion
-    def mixed_radix_decode(self, value):
+    def mixed_radix_decode(self, value, n_phases=2):
 		print 'value', value
-		factors = [2, 5, 4, 4]
-		res = [0,0,0,0]
-		for i in reversed(range(4)):
+		factors = self.__state_factors(n_phases)
+		res = [0] * len(factors)
+		for i in reversed(range(len(factors))):
 			res[i] = value % factors[i]
 			value = value / factors[i]
 			
 		print 'reverse %s' % (res)
             
     # change the traffic light phase        
-    # set yellow phase and save the next green
+    # set yellow phase (the one following the current green phase in the
+    # program) and save the next green
     def change_trafficlight(self, tlID):
-		if traci.trafficlights.getPhase(tlID) == 0: # NS phase
-			traci.trafficlights.setPhase(tlID, 1)
-			self.__trafficlights[tlID]["nextGreen"] = 3
-		elif traci.trafficlights.getPhase(tlID) == 3: # EW phase
-			traci.trafficlights.setPhase(tlID, 4)
-			self.__trafficlights[tlID]["nextGreen"] = 0
+		i = self.__tls_index[tlID]
+		green = self.__tls_green[i]
+		idPhase = self.__phase[i]
+		if idPhase in green:
+			self._traci_tls.setPhase(tlID, (idPhase + 1) % len(self.__tls_phases[i]))
+			self.__next_green[i] = green[(green.index(idPhase) + 1) % len(green)]
 
     
     # obs: traci.trafficlights.getPhaseDuration(tlID)  
 	# it is the time defined in .net file, not the current elapsed time
+	# (the elapsed green time, 'greenTime', is kept in an array, see reset_episode)
     def update_phaseTime(self, string, tlID):
-	     self.__trafficlights[tlID][string] += 1
+		if string == 'greenTime':
+			self.__green_time[self.__tls_index[tlID]] += 1
+		else:
+			self.__trafficlights[tlID][string] += 1
 	
 
-	#for states
-    def calculate_queue_size(self, tlID):
-		minSpeed = 2.8 # 10km/h - 2.78m/s
-		allVehicles = traci.vehicle.getIDList()
-		
-		for vehID in allVehicles:
-			traci.vehicle.subscribe(vehID, [traci.constants.VAR_LANE_ID, traci.constants.VAR_SPEED])
-			
-		info_veh = traci.vehicle.getSubscriptionResults()
+	# subscribe the current phase of the traffic lights, and the number of
+	# vehicles and the number of halting vehicles (speed below 0.1m/s) of the
+	# lanes controlled by them (the subscriptions are dropped at the end of each
+	# simulation, so this must be done at the beginning of every episode)
+    def __subscribe_lanes(self):
+		for tlID in self.__tls_ID:
+			self._traci_tls.subscribe(tlID, [traci.constants.TL_CURRENT_PHASE])
+		for lane in self.__lanes:
+			self._traci.lane.subscribe(lane, [traci.constants.LAST_STEP_VEHICLE_NUMBER, traci.constants.LAST_STEP_VEHICLE_HALTING_NUMBER])
 		
-		# VAR_LANE_ID = 81
-		# VAR_SPEED = 64 Returns the speed of the named vehicle within the last step [m/s]; error value: -1001	
+		self.__update_lanes_measures()
+	
+	# read the current phase of all traffic lights and compute the number of
+	# vehicles and of halting vehicles in the lanes of each green phase of all
+	# traffic lights, from the subscription results; this is done once per step,
+	# and the results are shared by the state (see calculate_new_states), the
+	# reward (see run_episode) and the metrics
+	# __phase[i] = current phase of the i-th traffic light
+	# __vehicles[i, p] = vehicles in the lanes of its p-th green phase (e.g. [NS, EW])
+	# __halting[i, p] = halting vehicles in such lanes
+	# __halting_tl[i] = halting vehicles in the (distinct) lanes of the i-th traffic light
+    def __update_lanes_measures(self):
+		results = sumobackend.all_subscription_results(self._traci_tls)
+		self.__phase = np.array([results[tlID][traci.constants.TL_CURRENT_PHASE] for tlID in self.__tls_ID])
 		
-		qNS = []
-		qEW = []
-		if len(info_veh) > 0:
-			for x in info_veh.keys():
-				if info_veh[x][81] in self._edgesNS[int(tlID)]:
-					qNS.append(x)
-				if info_veh[x][81] in self._edgesEW[int(tlID)]:
-					qEW.append(x)
+		results = sumobackend.all_subscription_results(self._traci.lane)
+		vehicles = np.array([results[lane][traci.constants.LAST_STEP_VEHICLE_NUMBER] for lane in self.__lanes])
+		halting = np.array([results[lane][traci.constants.LAST_STEP_VEHICLE_HALTING_NUMBER] for lane in self.__lanes])
 		
-		return [qNS, qEW]		
+		# sum the lanes' measures by green phase (see __create_edges)
+		shape = self.__tls_capacity.shape
+		self.__vehicles = np.bincount(self.__lanes_group, weights=vehicles[self.__lanes_lane], minlength=shape[0] * shape[1]).reshape(shape).astype(int)
+		self.__halting = np.bincount(self.__lanes_group, weights=halting[self.__lanes_lane], minlength=shape[0] * shape[1]).reshape(shape).astype(int)
+		self.__halting_tl = np.bincount(self.__tl_lanes_tl, weights=halting[self.__tl_lanes_lane], minlength=shape[0]).astype(int)
+	
+	#for states
+	# return the number of vehicles in the lanes of each green phase of the traffic light
+    def calculate_queue_size(self, tlID):
+		i = self.__tls_index[tlID]
+		return self.__vehicles[i, :len(self.__tls_green[i])].tolist()
 		
 	#for the reward
+	# return the number of halting vehicles in the lanes of each green phase of the traffic light
     def calculate_stopped_queue_length(self, tlID):
-		minSpeed = 2.8 # 10km/h - 2.78m/s
-		allVehicles = traci.vehicle.getIDList()
-		
-		for vehID in allVehicles:
-			traci.vehicle.subscribe(vehID, [traci.constants.VAR_LANE_ID, traci.constants.VAR_SPEED])
-			
-		info_veh = traci.vehicle.getSubscriptionResults()
-		
-		# VAR_LANE_ID = 81
-		# VAR_SPEED = 64 Returns the speed of the named vehicle within the last step [m/s]; error value: -1001	
-		
-		qNS = []
-		qEW = []
-		if len(info_veh) > 0:
-			for x in info_veh.keys():
-				if info_veh[x][64] <= minSpeed:
-					if info_veh[x][81] in self._edgesNS[int(tlID)]:
-						qNS.append(x)
-					if info_veh[x][81] in self._edgesEW[int(tlID)]:
-						qEW.append(x)
-		
-		return [len(qNS), len(qEW)]			
+		i = self.__tls_index[tlID]
+		return self.__halting[i, :len(self.__tls_green[i])].tolist()
  
 	   
     def calculate_new_state(self, tlID): 
-
-		# 1) index of the current phase
-		idPhase = traci.trafficlights.getPhase(tlID)
+		return int(self.calculate_new_states()[self.__tls_index[tlID]])
+	
+	# return the current state of all traffic lights (an array indexed by the
+	# traffic lights' positions, see __create_trafficlights)
+    def calculate_new_states(self):
+		
+		# 1) index of the current phase (among the green phases)
+		idPhase = self.__tls_green_pos[np.arange(len(self.__tls_ID)), self.__phase]
 							
 		# 2) the elapsed time in the current phase
 		# obs: duration = traci.trafficlights.getPhaseDuration(tlID)  
 		# its the time defined in .net file, not the current elapsed time
-		duration = self.__trafficlights[tlID]["greenTime"]
+		duration = self.__green_time
 
-		# 3) queue size 
-		qNS_list, qEW_list = self.calculate_queue_size(tlID)
-										
-		qNS = len(qNS_list)
-		qEW = len(qEW_list)
-			
-		# vehicle / capacity
-		qNS_occupation = 0
-		qEW_occupation = 0
-		if qNS > 0:
-			qNS_occupation = (qNS*100)/self._edgesNScapacity[int(tlID)]
-		if qEW > 0:
-			qEW_occupation = (qEW*100)/self._edgesEWcapacity[int(tlID)]
+		# 3) queue size: vehicle / capacity
+		occupations = (self.__vehicles * 100) / self.__tls_capacity
 
-		new_state = self.mixed_radix_encode(idPhase, duration ,qNS_occupation, qEW_occupation)
-		
-		return new_state
+		return self.__mixed_radix_encode_all(idPhase, duration, occupations, self.__tls_n_green)
 				
     def run_episode(self, max_steps=-1, arq_tl='saida_tl.txt', exp=None):
 		               
@@ -378,19 +412,20 @@ class SUMOTrafficLights(Environment):
 		self._episodes += 1
 		self.reset_episode()      
 
-		self.__init_edges_capacity()  # initialize the queue capacity of each traffic light
 		self.__create_tlogic()  
+		self.__subscribe_lanes()  # subscribe the measures of the traffic lights and their lanes
         
         #----------------------------------------------------------------------------------
      
 		current_time = 0
-		previousNSqueue = [0] * len(self.get_trafficlights_ID_list())
-		previousEWqueue = [0] * len(self.get_trafficlights_ID_list())
-		currentNSqueue = [0] * len(self.get_trafficlights_ID_list())
-		currentEWqueue = [0] * len(self.get_trafficlights_ID_list())
-		new_state = [0] * len(self.get_trafficlights_ID_list())
-		state = [0] * len(self.get_trafficlights_ID_list())
-		choose = [0] * len(self.get_trafficlights_ID_list()) # flag: if choose an action
+		# the arrays are indexed by the traffic lights' positions (see __create_trafficlights)
+		# the queues are the sums of the queues of all green phases of each traffic light
+		n_tls = len(self.get_trafficlights_ID_list())
+		previousqueue = np.zeros(n_tls) # previous average queue length
+		currentqueue = np.zeros(n_tls) # accumulated queue length since the last action
+		new_state = np.zeros(n_tls, dtype=int)
+		state = [0] * n_tls
+		change = np.zeros(n_tls, dtype=bool) # flag: if the selected action is 'change'
 		maxGreenTime = 180 # maximum green time, to prevent starvation
 		minGreenTime = 10
 		interv_action_selection = 5 # interval for action selection
@@ -398,31 +433,23 @@ class SUMOTrafficLights(Environment):
 
                                
         # main loop
-		while ((max_steps > -1 and traci.simulation.getCurrentTime() < max_steps) or max_steps <= -1) and (traci.simulation.getMinExpectedNumber() > 0 or traci.simulation.getArrivedNumber() > 0):
+		while ((max_steps > -1 and self._traci.simulation.getCurrentTime() < max_steps) or max_steps <= -1) and (self._traci.simulation.getMinExpectedNumber() > 0 or self._traci.simulation.getArrivedNumber() > 0):
 
-		
-			queueNS = [0] * len(self.get_trafficlights_ID_list())
-			queueEW = [0] * len(self.get_trafficlights_ID_list())
-		
-			learner_state_action = {}
-			for tlID in self.get_trafficlights_ID_list():
-				# A) LEARNER ACTION
-					# each traffic light makes a decision at each interv_action_selection (5s)
-					if self.__trafficlights[tlID]["greenTime"] > 9 and (self.__trafficlights[tlID]["greenTime"] % interv_action_selection) == 0 : 
-						new_state[int(tlID)] = self.calculate_new_state(tlID)
-						state[int(tlID)], action = self._learners[tlID].act_last(new_state[int(tlID)]) 
-						learner_state_action[tlID] = [state[int(tlID)], action]
-						# if green time is equal or more than maxGreenTime, change phase
-						if self.__trafficlights[tlID]["greenTime"] >= maxGreenTime:
-							learner_state_action[tlID] = [state[int(tlID)], 'change']
-						choose[int(tlID)] = True # flag: if choose an action
-					else:
-						choose[int(tlID)] = False
+			# A) LEARNER ACTION
+			# each traffic light makes a decision at each interv_action_selection (5s)
+			choose = (self.__green_time > 9) & (self.__green_time % interv_action_selection == 0) # flag: if choose an action
+			if choose.any():
+				new_state[choose] = self.calculate_new_states()[choose]
+				for i in np.flatnonzero(choose):
+					state[i], action = self._learners[self.__tls_ID[i]].act_last(int(new_state[i])) 
+					# if green time is equal or more than maxGreenTime, change phase
+					change[i] = action == 'change' or self.__green_time[i] >= maxGreenTime
 
 		 
 			# run a single simulation step 
-			traci.simulationStep()
-			current_time = traci.simulation.getCurrentTime()/1000
+			self._traci.simulationStep()
+			current_time = self._traci.simulation.getCurrentTime()/1000
+			self.__update_lanes_measures()
 
 			# update epsilon manually - traffic lights are not a episodic task
 			# maxGreenTime *2: to assure that the traffic ligth pass at least one time in each phase
@@ -431,72 +458,54 @@ class SUMOTrafficLights(Environment):
 				exp.update_epsilon_manually()
 
 			# before start needs 'change' or 'keep' the phase according to the selected action
-			for tlID in self.get_trafficlights_ID_list():
-				
-					# green phase: idPhase = 0 or 3 (when have two phases)
-					# if yellow or all red phase - do nothing
-					if traci.trafficlights.getPhase(tlID) == 0 or traci.trafficlights.getPhase(tlID) == 3:
-						self.update_phaseTime('greenTime', tlID)
+			# green phase (e.g. idPhase = 0 or 3, when have two phases)
+			# if yellow or all red phase - do nothing
+			green = self.__tls_green_pos[np.arange(n_tls), self.__phase] >= 0
+			self.__green_time[green] += 1
 			
-						# if choose == True: run the action (change, keep)
-						# else: just calculate the queue length (reward will be the average queue length) 
-						if choose[int(tlID)] == True: 
-							# B) RUN ACTION
-							if learner_state_action[tlID][1] == 'change': #TODO: more phases
-								self.__trafficlights[tlID]["greenTime"] = 0
-								
-								# this method must set yellow phase and save the next green phase
-								self.change_trafficlight(tlID)
-							else: # if action = 'keep' just calculte queue size
-								# calculate queue size
-								queueNS[int(tlID)], queueEW[int(tlID)] = self.calculate_stopped_queue_length(tlID)
-								
-								currentNSqueue[int(tlID)] += queueNS[int(tlID)]
-								currentEWqueue[int(tlID)] += queueEW[int(tlID)]
-													
-						else: 
-							# calculate queue size
-							queueNS[int(tlID)], queueEW[int(tlID)] = self.calculate_stopped_queue_length(tlID)
-							
-							currentNSqueue[int(tlID)] += queueNS[int(tlID)]
-							currentEWqueue[int(tlID)] += queueEW[int(tlID)]
+			# B) RUN ACTION
+			# if choose == True and action = 'change': set the yellow phase (the method
+			# must set yellow phase and save the next green phase)
+			# else: just calculate the queue length (reward will be the average queue length) 
+			changing = green & choose & change
+			self.__green_time[changing] = 0
+			for i in np.flatnonzero(changing):
+				self.change_trafficlight(self.__tls_ID[i])
 			
-						# if it will select action in the next step, 
-						# in the previous you need to calculate the feedback and update Q-table
-						if self.__trafficlights[tlID]["greenTime"] > (minGreenTime - 1) and (self.__trafficlights[tlID]["greenTime"] % interv_action_selection) == 0 and current_time > 13:
-							#  if current_time: it can enter in the beggining -  13 = 10 (minGreenTime) + 2 (yellow) + 1 (allRed)
-							
-							# calculate the average queue length 
-							if self.__trafficlights[tlID]["greenTime"] == minGreenTime: # action 'change': stay minGreenTime before select new action
-								aver_currentNSqueue = currentNSqueue[int(tlID)]/float(minGreenTime)
-								aver_currentEWqueue = currentEWqueue[int(tlID)]/float(minGreenTime)
-							else: # action 'keep': stay interv_action_selection before select new action
-								aver_currentNSqueue = currentNSqueue[int(tlID)]/float(interv_action_selection)
-								aver_currentEWqueue = currentEWqueue[int(tlID)]/float(interv_action_selection)
+			keeping = green & ~changing
+			currentqueue[keeping] += self.__halting[keeping].sum(axis=1)
+			
+			# if it will select action in the next step, 
+			# in the previous you need to calculate the feedback and update Q-table
+			#  if current_time: it can enter in the beggining -  13 = 10 (minGreenTime) + 2 (yellow) + 1 (allRed)
+			feedback = green & (self.__green_time > (minGreenTime - 1)) & (self.__green_time % interv_action_selection == 0)
+			if current_time > 13 and feedback.any():
+				
+				# calculate the average queue length 
+				# action 'change': stay minGreenTime before select new action
+				# action 'keep': stay interv_action_selection before select new action
+				aver_currentqueue = currentqueue / np.where(self.__green_time == minGreenTime, float(minGreenTime), float(interv_action_selection))
 
-							# C) CALCULATE REWARD
-							trafficlight_to_proces_feedback = {}
-														
-							# we define the reward as the difference between the previous and current average queue length (AQL)
-							# at the junction $R(s,a,s')= AQL_{s} - AQL_{s'}$
-							reward = ((aver_currentEWqueue + aver_currentNSqueue) - (previousEWqueue[int(tlID)] + previousNSqueue[int(tlID)]))
-							reward *= -1
-							
-							# D) PROCESS FEEDBACK
-							trafficlight_to_proces_feedback[tlID] = [
-								reward,
-								new_state[int(tlID)],
-								state[int(tlID)]
-							]
+				# C) CALCULATE REWARD
+				# we define the reward as the difference between the previous and current average queue length (AQL)
+				# at the junction $R(s,a,s')= AQL_{s} - AQL_{s'}$
+				reward = (aver_currentqueue - previousqueue) * -1
+				
+				# D) PROCESS FEEDBACK
+				trafficlight_to_proces_feedback = {}
+				for i in np.flatnonzero(feedback):
+					trafficlight_to_proces_feedback[self.__tls_ID[i]] = [
+						float(reward[i]),
+						int(new_state[i]),
+						state[i]
+					]
 
-							self.__process_trafficlights_feedback(trafficlight_to_proces_feedback)
-		
-							# update previous queue
-							previousNSqueue[int(tlID)] = aver_currentNSqueue
-							previousEWqueue[int(tlID)] = aver_currentEWqueue
-							# clean current queue
-							currentNSqueue[int(tlID)] = 0 
-							currentEWqueue[int(tlID)] = 0
+				self.__process_trafficlights_feedback(trafficlight_to_proces_feedback)
+
+				# update previous queue
+				previousqueue[feedback] = aver_currentqueue[feedback]
+				# clean current queue
+				currentqueue[feedback] = 0 
 						
 										
 			self.metrics(arq_tl, current_time)
@@ -512,34 +521,15 @@ class SUMOTrafficLights(Environment):
 			self._learners[str(tlID)].feedback_last(traffic_lights[tlID][0], traffic_lights[tlID][1], traffic_lights[tlID][2])
    
     def metrics(self, arquivo, current_time):
-		minSpeed = 2.8 # 10km/h - 2.78m/s
 
-		# using subcriptions
-		allVehicles = traci.vehicle.getIDList()
-		for vehID in allVehicles:
-			traci.vehicle.subscribe(vehID, [traci.constants.VAR_LANE_ID, traci.constants.VAR_SPEED])
-		
-		lanes = traci.vehicle.getSubscriptionResults()
-		
-		# VAR_LANE_ID = 81
-		# VAR_SPEED = 64 Returns the speed of the named vehicle within the last step [m/s]; error value: -1001	
-		# VAR_WAITING_TIME = 122 	Returns the waiting time [s]
-		
-		cont_veh_per_tl = [0] * len(self.get_trafficlights_ID_list())
-		if len(lanes) > 0:
-			for x in lanes.keys():
-				for tlID in self.get_trafficlights_ID_list(): 
-					if lanes[x][64] <= minSpeed:
-						if (lanes[x][81] in self._edgesNS[int(tlID)]) or (lanes[x][81] in self._edgesEW[int(tlID)]):
-							cont_veh_per_tl[int(tlID)] += 1
+		# number of halting vehicles in the lanes of each traffic light, each
+		# lane counted once (see __update_lanes_measures)
+		cont_veh_per_tl = self.__halting_tl
 
 		# save in a file 
 		# how many vehicles were in queue in each timestep
-		average_queue = 0
-		for tlID in self.get_trafficlights_ID_list():
-			average_queue = average_queue + cont_veh_per_tl[int(tlID)]
-		average_queue = average_queue/float(len(self.__trafficlights))
-		arquivo.writelines('%d,%s,%.1f,%d\n' % (current_time, str(cont_veh_per_tl)[1:-1], average_queue, len(allVehicles)))								
+		average_queue = cont_veh_per_tl.sum()/float(len(self.__trafficlights))
+		arquivo.writelines('%d,%s,%.1f,%d\n' % (current_time, str(cont_veh_per_tl.tolist())[1:-1], average_queue, self._traci.vehicle.getIDCount()))								
 	   
     def run_step(self):
         raise Exception('run_step is not available in %s class' % self)
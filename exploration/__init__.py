@@ -4,6 +4,7 @@ Created on 04/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 import abc
+import numpy as np
 
 class ExplorationStrategy:
     
@@ -14,6 +15,25 @@ class ExplorationStrategy:
     def choose(self, action_dict, episode):
         return
     
+    #Return the index of an action, given the list of the actions' Q-values
+    #(by default, the values are passed to choose as a dictionary index:Q-value)
+    def choose_index(self, values, episode):
+        return self.choose(dict(enumerate(values)), episode)
+    
+    #Return the indices of the actions chosen in a batch of decisions, given a
+    #matrix of Q-values (one row per decision) and a boolean matrix telling the
+    #valid entries (actions) of each row; -1 is returned for the rows without
+    #valid entries (by default, choose_index is called once per row)
+    def choose_batch(self, values, valid, episode):
+        ret = []
+        for row, mask in zip(values, valid):
+            columns = mask.nonzero()[0]
+            if len(columns) == 0:
+                ret.append(-1)
+            else:
+                ret.append(columns[self.choose_index(row[columns].tolist(), episode)])
+        return np.array(ret, dtype=int)
+    
     #Called only in the beginning of each episode
     @abc.abstractmethod
     def reset_episodic(self):
@@ -6,6 +6,7 @@ Created on 04/08/2014
 from exploration import ExplorationStrategy
 from tools import sampling
 import random
+import numpy as np
 
 class EpsilonGreedy(ExplorationStrategy):
     
@@ -19,6 +20,10 @@ class EpsilonGreedy(ExplorationStrategy):
         
     #Return an action, given an actions dictionary in the form action:Q-value
     def choose(self, action_dict, episode):
+        return action_dict.keys()[self.choose_index(action_dict.values(), episode)]
+    
+    #Return the index of an action, given the list of the actions' Q-values
+    def choose_index(self, values, episode):
 		
         #update epsilon value
         if  self._manual_decay == False and self._last_episode != episode and self._decay_rate > 0.0 and self._epsilon > self._min_epsilon:
@@ -30,19 +35,49 @@ class EpsilonGreedy(ExplorationStrategy):
         i = -1
         if r < self._epsilon:
             #select an action uniformly at random (exploration)
-            i = random.randint(0, len(action_dict)-1)
+            i = random.randint(0, len(values)-1)
             #~ print 'exploration', self._epsilon
         else:
             #select an action greedily (exploitation)
-            i = sampling.reservoir_sampling(action_dict.values(), True)
+            i = sampling.reservoir_sampling(values, True)
             #~ print 'exploitation', self._epsilon
         
         #update epsilon value
         if self._decay_rate > 0.0:
             self._epsilon = self._epsilon * self._decay_rate
         
-        #return selected action
-        return action_dict.keys()[i]
+        #return the index of the selected action
+        return i
+        
+    #Return the indices of the actions chosen in a batch of decisions (see
+    #ExplorationStrategy.choose_batch); the decisions are made at once, but
+    #epsilon is updated as if choose_index were called once per row
+    def choose_batch(self, values, valid, episode):
+        
+        #update epsilon value
+        if  self._manual_decay == False and self._last_episode != episode and self._decay_rate > 0.0 and self._epsilon > self._min_epsilon:
+            self._epsilon = self._epsilon * self._decay_rate
+        self._last_episode = episode
+        
+        #the epsilon of each decision
+        n = len(values)
+        epsilons = np.empty(n)
+        epsilons.fill(self._epsilon)
+        if self._decay_rate > 0.0:
+            epsilons *= self._decay_rate ** np.arange(n)
+            self._epsilon = self._epsilon * (self._decay_rate ** n)
+        
+        #the candidate actions of each decision: all actions (exploration)
+        #or those with the greatest Q-value (exploitation)
+        explore = np.random.random(n) < epsilons
+        masked = np.where(valid, values, -np.inf)
+        greedy = valid & (masked == masked.max(axis=1)[:, np.newaxis])
+        candidates = np.where(explore[:, np.newaxis], valid, greedy)
+        
+        #select one of the candidates uniformly at random
+        ret = np.where(candidates, np.random.random(candidates.shape), -1.0).argmax(axis=1)
+        ret[~valid.any(axis=1)] = -1
+        return ret
         
     def update_epsilon_manually(self):
 		if self._manual_decay == False:
@@ -1,5 +1,5 @@
 '''
-KSP v1.31
+KSP v1.5
 
 Created on February 10, 2014 by Gabriel de Oliveira Ramos <goramos@inf.ufrgs.br>
 
@@ -43,12 +43,70 @@ v1.3 (07-Jun-2016) -  Several adjustments to make the script compliant with the
 					  and (vi) minor issues.
 v1.31 (25-Aug-2016) - Small fixes related to edges names; according to the current network 
                       specification, links are named with a dash (A-B) rather than a pipe (A|B).
+v1.4 (18-Oct-2026) -  Dijkstra's algorithm now uses a binary heap and an indexed representation
+                      of the graph (class Graph), in which nodes are indexed by name and the
+                      outgoing edges of each node are stored in adjacency lists. The indexes are
+                      built once per KShortestPaths call (rather than scanning the lists of nodes
+                      and edges at every iteration). The routes found are the same as before.
+v1.41 (18-Oct-2026) - Created the function loadGraph(graph_file), which reads the network file
+                      once and returns the corresponding (indexed) graph, together with the
+                      functions getKRoutesGraph(G, origin, destination, K) and 
+                      getKRoutesODList(G, OD_list, K), which answer any number of queries on
+                      such a graph (without reading and parsing the network file again).
+                      The function getKRoutesNetFile now relies on them.
+v1.42 (18-Oct-2026) - The routes of different OD-pairs can now be computed in parallel by a pool
+                      of worker processes, which receive a copy of the graph once (when they are
+                      created). The number of processes is defined by the parameter 'processes'
+                      of getKRoutesODList and run, and by the option -j in the command line. 
+                      The results are always returned in the order of the OD-pairs.
+v1.43 (18-Oct-2026) - Speed up of the steps of Yen's algorithm: the graph now indexes the edges
+                      by their (start, end) nodes and the edges incident to each node, the edges 
+                      and nodes to be ignored by Dijkstra's algorithm are stored in sets, and the
+                      candidate paths (B) are kept in a heap ordered by cost (class CandidatePaths),
+                      where repeated paths are discarded by their hash. The routes found are the 
+                      same as before.
+v1.44 (18-Oct-2026) - Created the function getKRoutesODListCached(graph_file, OD_list, K), which
+                      stores the computed routes in a cache file, so that they are read rather 
+                      than computed again in future runs. The routes are identified by K and the
+                      OD-pair, and the whole cache is invalidated whenever the (hash of the) 
+                      content of the network file changes. The cache file can be shared by 
+                      several processes (it is locked while updated and replaced atomically).
+v1.45 (18-Oct-2026) - The edges now keep their cost functions, which allows updating their costs
+                      according to new flows with the function updateEdgesCosts(G, flows) (the 
+                      cost functions are evaluated at once for all edges sharing them). Created 
+                      the function updateKRoutesODList(G, OD_list, K, R, changed), which updates
+                      a set of routes after such a change, recomputing only the OD-pairs that may
+                      have been affected by the edges whose costs changed.
+v1.5 (18-Oct-2026) -  The graph is now stored in compressed sparse row format (see tools.graph),
+                      in which nodes and edges are represented by integer ids. Dijkstra's and 
+                      Yen's algorithms work on such ids, which are converted back to nodes and 
+                      edges (or their names) only when the results are returned. Created the
+                      function graphFromCSR(csr), which creates the graph from the CSR 
+                      representation (eg, from a SUMO network). The routes found are the same 
+                      as before.
 <new versions here>
 
 '''
 
 #!/usr/bin/python
 import argparse
+import heapq
+import multiprocessing
+import hashlib
+import cPickle
+import tempfile
+import os
+import sys
+import numpy as np
+try:
+	from tools.graph import CSRGraph
+except ImportError: # when the script is run from the command line
+	sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+	from tools.graph import CSRGraph
+try:
+	import fcntl
+except ImportError: # not available on Windows (the cache is then updated without locking)
+	fcntl = None
 from py_expression_eval import Parser
 
 # represents a node in the graph
@@ -61,11 +119,82 @@ class Node:
 
 # represents an edge in the graph
 class Edge:
-	def __init__(self, name, u, v, cost):
+	def __init__(self, name, u, v, cost, function=None, constants=None):
 		self.name = name
 		self.start = u
 		self.end = v
-		self.cost = cost # represents the edge's cost under free flow
+		self.cost = cost # represents the edge's cost under free flow (or under the last flow set by updateEdgesCosts)
+		self.function = function # the cost function, in the form [parameter, constants' names, parsed expression]
+		self.constants = constants # the values of the cost function's constants (dictionary)
+
+# represents the graph defined by the lists of nodes (V) and edges (E), indexed
+# to speed up the shortest path computations (the indexes are built once and 
+# then reused by all searches made on the same lists); the topology is stored
+# in CSR format, where nodes are identified by their position in V (ties among
+# nodes with the same distance are broken in favour of the first one in V)
+class Graph:
+	def __init__(self, V, E, OD=None):
+		self.V = V
+		self.E = E
+		self.OD = OD # OD pairs (only when the graph was read from a network file)
+		
+		# the graph in CSR format
+		self.csr = CSRGraph([node.name for node in V], [[edge.name, edge.start, edge.end, edge.cost] for edge in E])
+		
+		# nodes and edges by their ids (in the case of repeated node names, 
+		# the first node is considered), and the ids of the edges
+		self.nodes = {}
+		for node in V:
+			if node.name not in self.nodes:
+				self.nodes[node.name] = node
+		self.node_list = [self.nodes[name] for name in self.csr.node_names]
+		self.edge_list = [E[i] for i in self.csr.input_index.tolist()]
+		self.edge_ids = dict((edge, e) for e, edge in enumerate(self.edge_list))
+		
+		# edges by their (start, end) nodes' names (in the case of parallel 
+		# edges, the first one in E is kept, as in getEdge)
+		self.edges = {}
+		for edge in E:
+			if (edge.start, edge.end) not in self.edges:
+				self.edges[(edge.start, edge.end)] = edge
+	
+	# return the id of the first edge from node u to node v (ids), or None
+	def edge_id(self, u, v):
+		return self.csr.pair_ids.get((u, v))
+	
+	# return the ids of the nodes in the path S (a list of nodes)
+	def path_to_ids(self, S):
+		return [self.csr.node_ids[node.name] for node in S]
+	
+	# return the path (a list of nodes) corresponding to the given ids
+	def ids_to_path(self, P):
+		return [self.node_list[u] for u in P]
+
+# represents the set of candidate paths (B) of Yen's algorithm, which are kept
+# in a heap ordered by cost and then by insertion order (ties are thus broken 
+# in favour of the oldest path); repeated paths are discarded
+class CandidatePaths:
+	def __init__(self):
+		self.heap = []
+		self.paths = set()
+		self.count = 0
+	
+	# add the path S (with the given cost), if it is not yet a candidate
+	def push(self, S, cost):
+		key = tuple(S)
+		if key not in self.paths:
+			self.paths.add(key)
+			heapq.heappush(self.heap, (cost, self.count, S))
+			self.count += 1
+	
+	# remove and return the cheapest path
+	def pop(self):
+		_, _, S = heapq.heappop(self.heap)
+		self.paths.remove(tuple(S))
+		return S
+	
+	def __len__(self):
+		return len(self.heap)
 
 # read a text file and generate the graph according to declarations
 def generateGraph(graph_file):
@@ -117,14 +246,15 @@ def generateGraph(graph_file):
 			
 			# process the cost
 			function = F[taglist[4]] # get the corresponding function
-			param_values = dict(zip(function[1], map(float, taglist[5:]))) # associate constants and values specified in the line (in order of occurrence)
+			constants = dict(zip(function[1], map(float, taglist[5:]))) # associate constants and values specified in the line (in order of occurrence)
+			param_values = dict(constants)
 			param_values[function[0]] = 0.0 # add the parameter with value 0
 			cost = function[2].evaluate(param_values) # calculate the cost
 			
 			# create the edge(s)
-			E.append(Edge(taglist[1], taglist[2], taglist[3], cost))
+			E.append(Edge(taglist[1], taglist[2], taglist[3], cost, function, constants))
 			if taglist[0] == 'edge':
-				E.append(Edge(taglist[1], taglist[3], taglist[2], cost))
+				E.append(Edge(taglist[1], taglist[3], taglist[2], cost, function, constants))
 			
 		elif taglist[0] == 'od':
 			OD.append(taglist[1])
@@ -193,82 +323,118 @@ def pickEdgesListAll(u, E):
 			uv.append(edge)
 	return uv
 
-# Dijkstra's shortest path algorithm
-def findShortestPath(N, E, origin, destination, ignoredEdges):
+# Dijkstra's shortest path algorithm (binary heap version); the indexed 
+# graph G may be provided by the caller to avoid rebuilding it at each call,
+# and ignoredEdges should preferably be a set; besides the ignored edges, the
+# edges arriving at the nodes whose names are in ignoredNodes are also ignored
+def findShortestPath(N, E, origin, destination, ignoredEdges, G=None, ignoredNodes=()):
 	
-	# reset the graph (so as to discard information from previous runs)
-	resetGraph(N, E)
+	# index the graph (if not provided)
+	if G == None:
+		G = Graph(N, E)
 	
-	# set origin node distance to zero, and get destination node
-	dest = None
-	for node in N:
-		if node.name == origin:
-			node.dist = 0
-		if node.name == destination:
-			dest = node
-	
-	u = pickSmallestNode(N)
-	while u != None:
-		u.flag = 1
-		uv = pickEdgesList(u, E)
-		n = None
-		for edge in uv:
-			
-			# avoid ignored edges
-			if edge in ignoredEdges:
-				continue
-			
-			# take the node n
-			for node in N:
-				if node.name == edge.end:
-					n = node
-					break
-			if n.dist > u.dist + edge.cost:
-				n.dist = u.dist + edge.cost
-				n.prev = u
+	# translate the arguments to ids, run the algorithm, and translate the path back
+	ignoredEdges = set(G.edge_ids[edge] for edge in ignoredEdges if edge in G.edge_ids)
+	ignoredNodes = set(G.csr.node_ids[name] for name in ignoredNodes if name in G.csr.node_ids)
+	P = findShortestPathIds(G, G.csr.node_ids.get(origin), G.csr.node_ids.get(destination), ignoredEdges, ignoredNodes)
+	
+	return G.ids_to_path(P)
+
+# Dijkstra's shortest path algorithm on the CSR representation of graph G; 
+# origin and destination are node ids (origin may be None), ignoredEdges is a
+# set of edge ids, and the edges arriving at the nodes in ignoredNodes (a set of
+# node ids) are also ignored; return the path as a list of node ids (if the 
+# destination is not reachable, the path contains only the destination, and
+# if the destination is None, i.e., not in the graph, the path is empty)
+def findShortestPathIds(G, origin, destination, ignoredEdges, ignoredNodes):
+	
+	if destination == None:
+		return []
+	
+	offsets, targets, costs = G.csr.lists()
+	
+	# distance to each node from the origin, previous node, and access flag
+	size = len(offsets) - 1
+	dist = [1000000.0] * size
+	prev = [-1] * size
+	flag = [False] * size
+	
+	# set origin node distance to zero
+	heap = []
+	if origin != None:
+		dist[origin] = 0
+		heap.append((0, origin))
+	
+	while heap:
+		du, u = heapq.heappop(heap)
+		
+		# discard outdated entries of nodes already visited
+		if flag[u]:
+			continue
+		flag[u] = True
 		
-		u = pickSmallestNode(N)
 		# stop when destination is reached
-		if u == dest:
+		if u == destination:
 			break
+		
+		for e in xrange(offsets[u], offsets[u+1]):
+			n = targets[e]
+			
+			# avoid ignored edges (and ignored nodes)
+			if e in ignoredEdges or n in ignoredNodes:
+				continue
+			
+			if dist[n] > du + costs[e]:
+				dist[n] = du + costs[e]
+				prev[n] = u
+				heapq.heappush(heap, (dist[n], n))
 	
 	# generate the final path
-	S = []
-	u = dest
-	while u.prev != None:
-		S.insert(0,u)
-		u = u.prev
-	S.insert(0,u)
+	P = [destination]
+	while prev[P[-1]] != -1:
+		P.append(prev[P[-1]])
+	P.reverse()
 	
-	return S
+	return P
 
 # generate a string from the path S in a specific format
-def pathToString(S, E):
+def pathToString(S, E, G=None):
 	strout = '['
 	for i in xrange(0,len(S)-1):
 		if i > 0:
 			strout += ', '
-		strout += '\'' + getEdge(E, S[i].name, S[i+1].name).name + '\''
+		strout += '\'' + getEdge(E, S[i].name, S[i+1].name, G).name + '\''
 	return strout + ']'
 
 # generate a list with the edges' names of a given route S
-def pathToListOfString(S, E):
+def pathToListOfString(S, E, G=None):
 	lout = []
 	for i in xrange(0,len(S)-1):
-		lout.append(getEdge(E, S[i].name, S[i+1].name).name)
+		lout.append(getEdge(E, S[i].name, S[i+1].name, G).name)
 	return lout
 
-# get the directed edge from u to v
-def getEdge(E, u, v):
+# get the directed edge from u to v (if the indexed graph G is provided, 
+# the edge is taken from its index rather than searched in E)
+def getEdge(E, u, v, G=None):
+	if G != None:
+		return G.edges.get((u, v))
 	for edge in E:
 		if edge.start == u and edge.end == v:
 			return edge
 	return None
 
-def runKShortestPathsStep(V, E, origin, destination, k, A, B):
+# run step k of Yen's algorithm on the CSR representation of graph G; origin 
+# and destination are node ids, and the paths in A (the K shortest paths) and B 
+# (the candidate paths, see CandidatePaths) are lists of node ids
+def runKShortestPathsStep(V, E, origin, destination, k, A, B, G=None):
+	
+	# index the graph (if not provided)
+	if G == None:
+		G = Graph(V, E)
+	
 	# Step 0: iteration 1
 	if k == 1:
-		A.append(findShortestPath(V, E, origin, destination, []))
+		A.append(findShortestPathIds(G, origin, destination, set(), set()))
 		
 	# Step I: iterations 2 to K
 	else:
@@ -277,57 +443,63 @@ def runKShortestPathsStep(V, E, origin, destination, k, A, B):
 			# Step I(a)
 			spurNode = lastPath[i]
 			rootPath = lastPath[0:i+1]
-			toIgnore = []
+			toIgnore = set()
 			
 			for path in A:
 				if path[0:i+1] == rootPath:
-					ed = getEdge(E, spurNode.name, path[i+1].name)
-					toIgnore.append(ed)
+					toIgnore.add(G.edge_id(spurNode, path[i+1]))
 			
 			# ignore the edges passing through nodes already in rootPath (except for the spurNode)
-			for noder in rootPath[:-1]: 
-				edgesn = pickEdgesListAll(noder, E)
-				for ee in edgesn:
-					toIgnore.append(ee)
+			nodesToIgnore = set(rootPath[:-1])
 			
 			# Step I(b)
-			spurPath = findShortestPath(V, E, spurNode.name, destination, toIgnore)
+			spurPath = findShortestPathIds(G, spurNode, destination, toIgnore, nodesToIgnore)
 			if spurPath[0] != spurNode:
 				continue
 			
 			# Step I(c)
 			totalPath = rootPath + spurPath[1:]
-			B.append(totalPath)
+			B.push(totalPath, calcPathCostIds(totalPath, G))
 		
 		# handle the case where no spurs (new paths) are available
 		if not B:
 			return False
 			
 		# Step II
-		bestInB = None
-		bestInBcost = 999999999
-		for path in B:
-			cost = calcPathCost(path, E)
-			if cost < bestInBcost:
-				bestInBcost = cost
-				bestInB = path
-		A.append(bestInB)
-		while bestInB in B:
-			B.remove(bestInB)
+		A.append(B.pop())
 		
 	return True
 
-# Yen's K shortest loopless paths algorithm
-def KShortestPaths(V, E, origin, destination, K):
+# Yen's K shortest loopless paths algorithm; the indexed graph G may be 
+# provided by the caller to avoid rebuilding it at each call
+def KShortestPaths(V, E, origin, destination, K, G=None):
+	
+	# index the graph (it is shared by all Dijkstra's runs)
+	if G == None:
+		G = Graph(V, E)
+	
+	# run the algorithm on ids, and translate the paths back to nodes
+	return [G.ids_to_path(P) for P in KShortestPathsIds(G, origin, destination, K)]
+
+# Yen's K shortest loopless paths algorithm on the CSR representation of 
+# graph G; origin and destination are node names, and the paths are returned 
+# as lists of node ids
+def KShortestPathsIds(G, origin, destination, K):
 	# the K shortest paths
 	A = []
 	
 	# potential shortest paths
-	B = []
+	B = CandidatePaths()
+	
+	# (an unknown destination yields no paths)
+	destination = G.csr.node_ids.get(destination)
+	if destination == None:
+		print 'Problem on generating more paths! Only 0 paths were found!'
+		return A
 	
 	for k in xrange(1,K+1):
 		try:
-			if not runKShortestPathsStep(V, E, origin, destination, k, A, B):
+			if not runKShortestPathsStep(G.V, G.E, G.csr.node_ids.get(origin), destination, k, A, B, G):
 				break
 		except:
 			print 'Problem on generating more paths! Only %d paths were found!' % (k-1)
@@ -335,22 +507,36 @@ def KShortestPaths(V, E, origin, destination, K):
 		
 	return A
 
+# calculate the cost of path P (a list of node ids) on graph G
+def calcPathCostIds(P, G):
+	costs = G.csr.lists()[2]
+	cost = 0
+	for i in xrange(0, len(P)-1):
+		cost += costs[G.edge_id(P[i], P[i+1])]
+	return cost
+
+# generate a list with the edges' names of a given path P (a list of node ids)
+def pathIdsToListOfString(P, G):
+	return [G.csr.edge_names[G.edge_id(P[i], P[i+1])] for i in xrange(0, len(P)-1)]
+
 # calculate path S's cost
-def calcPathCost(S, E):
+def calcPathCost(S, E, G=None):
 	cost = 0
 	prev = None
 	for node in S:
 		if prev != None:
-			cost += getEdge(E, prev.name, node.name).cost
+			cost += getEdge(E, prev.name, node.name, G).cost
 		prev = node
 	
 	return cost
 
-# main procedure for many OD-pairs
-def run(graph_file, K, OD_pairs=None):
+# main procedure for many OD-pairs (the OD-pairs are processed by the given 
+# number of processes; see getKRoutesODList)
+def run(graph_file, K, OD_pairs=None, processes=1):
 	
 	# read graph from file
-	N, E, OD = generateGraph(graph_file)
+	G = loadGraph(graph_file)
+	OD = G.OD
 	
 	# process the list of OD-pairs (if no OD pair was defined by the 
 	# user, then all OD pairs from the network file are considered)
@@ -360,64 +546,336 @@ def run(graph_file, K, OD_pairs=None):
 		OD[i] = OD[i].split('|')
 	
 	# find K shortest paths of each OD-pair
+	R = getKRoutesODList(G, OD, K, processes)
+	
 	print 'ksptable = ['
 	lastod = len(OD)-1
 	for iod, (o, d) in enumerate(OD):
-		# find K shortest paths for this specific OD-pair
-		S = KShortestPaths(N, E, o, d, K)
+		# the K shortest paths of this specific OD-pair
+		S = R[iod]
 		
 		# print the result for this specific OD-pair
 		print '\t[ # ' + str(o) + '|' + str(d) + ' flow'
 		last = len(S)-1
-		for i, path in enumerate(S):
+		for i, (route, cost) in enumerate(S):
 			comma = ','
 			if i == last:
 				comma = ''
-			print '\t\t' + pathToString(path, E) + comma + " # cost " + str(calcPathCost(path, E))
+			print '\t\t[' + ', '.join('\'' + e + '\'' for e in route) + ']' + comma + " # cost " + str(cost)
 		comma = ','
 		if iod == lastod:
 			comma = ''
 		print '\t]' + comma
 	print ']'
 
+# read the network file and return the corresponding (indexed) graph, which can
+# then be used to answer many queries without reading the file again (this 
+# function was created to be called externally by another applications)
+def loadGraph(graph_file):
+	N, E, OD = generateGraph(graph_file)
+	return Graph(N, E, OD)
+
+# return the (indexed) graph corresponding to the given CSR representation (see
+# tools.graph.CSRGraph; eg, the one created from a SUMO network), which can then 
+# be used as the one returned by loadGraph
+def graphFromCSR(csr, OD=None):
+	N = [Node(name) for name in csr.node_names]
+	E = [Edge(csr.edge_names[e], csr.node_names[u], csr.node_names[v], cost) for e, (u, v, cost) in enumerate(zip(csr.sources.tolist(), csr.targets.tolist(), csr.costs.tolist()))]
+	return Graph(N, E, OD)
+
 # return a list with the K shortest paths for the given origin-destination pair,
 # given a network file (this function was created to be called externally by 
-# another applications)
+# another applications; to run several OD-pairs on the same network, prefer
+# loadGraph and getKRoutesGraph/getKRoutesODList, which read the file once)
 def getKRoutesNetFile(graph_file, origin, destination, K):
 	
-	lout = []
-	
 	# read graph from file
-	N, E, _ = generateGraph(graph_file)
+	G = loadGraph(graph_file)
 	
 	# find K shortest paths for this specific OD-pair
-	S = KShortestPaths(N, E, origin, destination, K)
-	
-	for path in S:
-		# store the path (in list of strings format) and cost to the out list 
-		lout.append([pathToListOfString(path, E), calcPathCost(path, E)])
-		
-	return lout
+	return getKRoutesGraph(G, origin, destination, K)
 
 # return a list with the K shortest paths for the given origin-destination pair,
-# given the lists of nodes and edges (this function was created to be called 
+# given a graph created by loadGraph (this function was created to be called 
 # externally by another applications)
-def getKRoutes(N, E, origin, destination, K):
+def getKRoutesGraph(G, origin, destination, K):
 	
 	lout = []
 	
 	# find K shortest paths for this specific OD-pair
-	S = KShortestPaths(N, E, origin, destination, K)
+	S = KShortestPathsIds(G, origin, destination, K)
 	
 	for path in S:
 		# store the path (in list of strings format) and cost to the out list 
-		lout.append([pathToListOfString(path, E), calcPathCost(path, E)])
+		lout.append([pathIdsToListOfString(path, G), calcPathCostIds(path, G)])
 		
 	return lout
+
+# return a list with the K shortest paths of each OD-pair in OD_list (a list of
+# [origin, destination] pairs, as returned by SUMORouteChoice.get_OD_pairs()), 
+# given a graph created by loadGraph; the i-th element of the returned list 
+# corresponds to the i-th OD-pair, and is in the same format returned by
+# getKRoutesGraph. The OD-pairs are distributed among the given number of 
+# processes (if None or 0, the number of CPUs is used), each one with its own
+# copy of the graph (this function was created to be called externally by 
+# another applications)
+def getKRoutesODList(G, OD_list, K, processes=1):
+	
+	if not processes:
+		processes = multiprocessing.cpu_count()
+	processes = min(processes, len(OD_list))
+	
+	# sequential version
+	if processes <= 1:
+		return [getKRoutesGraph(G, origin, destination, K) for origin, destination in OD_list]
+	
+	# parallel version (the graph is sent to the workers only once, when 
+	# they are created, and the results are collected in the order of OD_list)
+	pool = multiprocessing.Pool(processes, initWorker, (G,))
+	try:
+		chunksize = max(1, len(OD_list) / (processes * 4))
+		return pool.map(runWorker, [[origin, destination, K] for origin, destination in OD_list], chunksize)
+	finally:
+		pool.close()
+		pool.join()
+
+# graph used by the worker processes of getKRoutesODList
+workerGraph = None
+
+# initialise a worker process of getKRoutesODList with the graph
+def initWorker(G):
+	global workerGraph
+	workerGraph = G
+
+# compute the K shortest paths of an [origin, destination, K] query within 
+# a worker process of getKRoutesODList
+def runWorker(query):
+	return getKRoutesGraph(workerGraph, query[0], query[1], query[2])
+
+# return the same list returned by getKRoutesODList, but given the network file; 
+# the routes are read from a cache file (by default, the network file's name 
+# followed by '.kspcache') and only the OD-pairs not yet in the cache are computed 
+# (and then stored in the cache); if the content of the network file has changed
+# since the cache was created, all routes are computed again (this function was
+# created to be called externally by another applications)
+def getKRoutesODListCached(graph_file, OD_list, K, cache_file=None, processes=1):
+	
+	if cache_file == None:
+		cache_file = graph_file + '.kspcache'
+	
+	# read the routes already computed for this version of the network file
+	net_hash = hashNetFile(graph_file)
+	routes = readRoutesCache(cache_file, net_hash).get(K, {})
+	
+	# compute the routes of the OD-pairs not yet in the cache, and store them
+	missing = [[o, d] for o, d in OD_list if (o, d) not in routes]
+	if missing:
+		G = loadGraph(graph_file)
+		new_routes = {}
+		for (o, d), R in zip(missing, getKRoutesODList(G, missing, K, processes)):
+			new_routes[(o, d)] = R
+		updateRoutesCache(cache_file, net_hash, K, new_routes)
+		routes.update(new_routes)
+	
+	return [routes[(o, d)] for o, d in OD_list]
+
+# return the hash of the content of the network file
+def hashNetFile(graph_file):
+	h = hashlib.sha1()
+	with open(graph_file, 'rb') as f:
+		for chunk in iter(lambda: f.read(65536), ''):
+			h.update(chunk)
+	return h.hexdigest()
+
+# return the routes stored in the cache file as a dictionary in the form 
+# {K: {(origin, destination): routes}}; the cache is ignored (and an empty
+# dictionary is returned) if it does not exist, is not readable, or was
+# created for another version of the network file (i.e., with another hash) 
+def readRoutesCache(cache_file, net_hash):
+	try:
+		with open(cache_file, 'rb') as f:
+			cache = cPickle.load(f)
+		if cache['hash'] == net_hash:
+			return cache['routes']
+	except (IOError, EOFError, KeyError, TypeError, cPickle.UnpicklingError):
+		pass
+	return {}
+
+# add the given routes (a dictionary in the form {(origin, destination): routes})
+# to the cache file; the cache file is locked while updated (so that the routes 
+# stored by other processes in the meantime are kept) and replaced atomically 
+# (so that it can be read by other processes at any time)
+def updateRoutesCache(cache_file, net_hash, K, routes):
+	lock = open(cache_file + '.lock', 'a')
+	try:
+		if fcntl:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+		
+		# merge the given routes with the current content of the cache
+		cache = readRoutesCache(cache_file, net_hash)
+		cache.setdefault(K, {}).update(routes)
+		
+		# write the cache to a temporary file and then replace the cache file
+		fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_file)))
+		with os.fdopen(fd, 'wb') as f:
+			cPickle.dump({'hash': net_hash, 'routes': cache}, f, cPickle.HIGHEST_PROTOCOL)
+		os.chmod(tmp_file, 0644)
+		os.rename(tmp_file, cache_file)
+		
+	finally:
+		if fcntl:
+			fcntl.flock(lock, fcntl.LOCK_UN)
+		lock.close()
+
+# update the costs of the edges of G according to the given flows, by evaluating
+# their cost functions; flows may be either a dictionary in the form {edge name: flow}
+# or a list with the flow of each edge in G.E (in the same order); alternatively,
+# the costs themselves may be given (in the same formats), in which case no cost 
+# function is evaluated; the edges not present in the dictionaries keep their costs.
+# The cost functions are evaluated at once (in vectorised form) for all edges
+# sharing them. Return a dictionary with the previous cost of each edge whose cost
+# has changed (see updateKRoutesODList)
+def updateEdgesCosts(G, flows=None, costs=None):
+	
+	values = flows
+	if costs != None:
+		values = costs
+	
+	# the edges being updated (indices in G.E) and the corresponding flows/costs
+	if type(values) is dict:
+		idx = [i for i, edge in enumerate(G.E) if edge.name in values]
+		values = np.array([values[G.E[i].name] for i in idx], dtype=float)
+	else:
+		idx = range(len(G.E))
+		values = np.asarray(values, dtype=float)
+	
+	# calculate the new costs
+	new_costs = values
+	if costs == None:
+		new_costs = np.empty(len(idx))
+		
+		# group the edges by cost function
+		groups = {}
+		for j, i in enumerate(idx):
+			if G.E[i].function == None:
+				raise Exception('The cost function of edge %s is unknown!' % G.E[i].name)
+			groups.setdefault(id(G.E[i].function), []).append(j)
+		
+		# evaluate the functions at once for all edges in each group
+		for J in groups.values():
+			param, constants, function = G.E[idx[J[0]]].function
+			param_values = dict((c, np.array([G.E[idx[j]].constants[c] for j in J])) for c in constants)
+			param_values[param] = values[J]
+			try:
+				new_costs[J] = function.evaluate(param_values)
+			except Exception:
+				# functions that cannot be evaluated in vectorised form (eg, those 
+				# using functions from the math module) are evaluated edge by edge
+				for j in J:
+					param_values = dict(G.E[idx[j]].constants)
+					param_values[param] = values[j]
+					new_costs[j] = function.evaluate(param_values)
+	
+	# update the costs (of both the edges and the CSR representation)
+	changed = {}
+	for j, i in enumerate(idx):
+		cost = float(new_costs[j])
+		if cost != G.E[i].cost:
+			changed[G.E[i]] = G.E[i].cost
+			G.E[i].cost = cost
+	ids = [G.edge_ids[edge] for edge in changed if edge in G.edge_ids]
+	G.csr.set_costs(ids, [G.edge_list[e].cost for e in ids])
+	
+	return changed
+
+# update the list R with the K shortest paths of each OD-pair in OD_list (as returned
+# by getKRoutesODList) after the costs of some edges of G have changed (changed is
+# the dictionary returned by updateEdgesCosts); only the OD-pairs that may have been
+# affected by the changes are recomputed, namely those (i) whose routes traverse 
+# an edge whose cost has changed, or (ii) for which an edge whose cost has decreased
+# may now be part of a route cheaper than their K-th route; return the updated list 
+# (R itself is not changed)
+def updateKRoutesODList(G, OD_list, K, R, changed, processes=1):
+	
+	changed_names = set(edge.name for edge in changed)
+	decreased = [edge for edge in changed if edge.cost < changed[edge]]
+	
+	# distances from the origins and to the destinations (computed on demand,
+	# only if some edge has become cheaper)
+	dist_from = {}
+	dist_to = {}
+	
+	recompute = []
+	for i, (o, d) in enumerate(OD_list):
+		
+		# (i) OD-pairs whose routes traverse changed edges
+		if any(name in changed_names for route, _ in R[i] for name in route):
+			recompute.append(i)
+		
+		# (ii) OD-pairs for which cheaper edges may create better routes (if less 
+		# than K routes were found, then no other loopless route exists at all)
+		elif decreased and len(R[i]) == K:
+			if o not in dist_from:
+				dist_from[o] = shortestDistances(G, o)
+			if d not in dist_to:
+				dist_to[d] = shortestDistances(G, d, True)
+			worst = max(cost for _, cost in R[i])
+			for edge in decreased:
+				if edge.start in dist_from[o] and edge.end in dist_to[d] and dist_from[o][edge.start] + edge.cost + dist_to[d][edge.end] <= worst:
+					recompute.append(i)
+					break
+	
+	# recompute the affected OD-pairs
+	R = list(R)
+	for i, RKSP in zip(recompute, getKRoutesODList(G, [OD_list[i] for i in recompute], K, processes)):
+		R[i] = RKSP
+	
+	return R
+
+# return a dictionary with the (shortest) distance from the node named source to
+# each node reachable from it; if reverse is True, then the distances are computed
+# from each node to source
+def shortestDistances(G, source, reverse=False):
+	
+	offsets, targets, costs = G.csr.lists()
+	edges = None
+	if reverse:
+		offsets, edges = G.csr.reverse()
+		sources = G.csr.sources.tolist()
+	
+	dist = {}
+	if source not in G.csr.node_ids:
+		return dist
+	
+	heap = [(0.0, G.csr.node_ids[source])]
+	while heap:
+		du, u = heapq.heappop(heap)
+		if u in dist:
+			continue
+		dist[u] = du
+		for i in xrange(offsets[u], offsets[u+1]):
+			if reverse:
+				e = edges[i]
+				n = sources[e]
+			else:
+				e = i
+				n = targets[e]
+			if n not in dist:
+				heapq.heappush(heap, (du + costs[e], n))
+	
+	return dict((G.csr.node_names[u], d) for u, d in dist.iteritems())
+
+# return a list with the K shortest paths for the given origin-destination pair,
+# given the lists of nodes and edges (this function was created to be called 
+# externally by another applications)
+def getKRoutes(N, E, origin, destination, K):
+	
+	# find K shortest paths for this specific OD-pair
+	return getKRoutesGraph(Graph(N, E), origin, destination, K)
 	
 # initializing procedure
 if __name__ == '__main__':
-	parser = argparse.ArgumentParser(description='KSP v1.31\nCompute the K shortest loopless paths between two nodes of a given graph, using Yen\'s algorithm [1]. Complete instructions available at [2].',
+	parser = argparse.ArgumentParser(description='KSP v1.5\nCompute the K shortest loopless paths between two nodes of a given graph, using Yen\'s algorithm [1]. Complete instructions available at [2].',
 		epilog='GRAPH FILE FORMATTING INSTRUCTIONS' +
 		'\nSee [3] for complete instructions.'+
 		'\n\nREFERENCES' +
@@ -434,10 +892,13 @@ if __name__ == '__main__':
 						help='number of shortest paths to find')
 	parser.add_argument('-l', dest='OD_list', required=False,
 						help='list of OD-pairs, in the format \'O|D;O|D;[and so on]\', where O are valid origin nodes, and D are valid destination nodes')
+	parser.add_argument('-j', dest='processes', type=int, default=1,
+						help='number of processes used to compute the routes of different OD-pairs in parallel (0 for the number of CPUs; default 1)')
 	args = parser.parse_args()
 	
 	graph_file = args.file
 	OD_list = args.OD_list
 	K = args.K
+	processes = args.processes
 	
-	run(graph_file, K, OD_list)
+	run(graph_file, K, OD_list, processes)
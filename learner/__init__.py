@@ -5,10 +5,22 @@ Created on 06/08/2014
 '''
 import abc
 
+# the optional phases of the act and feedback methods (i.e., all but act_last and
+# feedback_last), in the order they are run by the environments
+ACT_PHASES = ['act1', 'act2', 'act3', 'act4']
+FEEDBACK_PHASES = ['feedback1', 'feedback2', 'feedback3']
+
 class Learner(object):
     
     __metaclass__ = abc.ABCMeta
     
+    # the optional phases (see ACT_PHASES and FEEDBACK_PHASES) actually used by
+    # the learner; the environments skip the phases not used by any of their
+    # learners (see Environment.run_phases), so the learners that implement
+    # some of them as no-ops should declare only the remaining ones (by default,
+    # all phases are assumed to be used)
+    _phases = ACT_PHASES + FEEDBACK_PHASES
+    
     def __init__(self, name, env, child_instance):
         
         self._name = name
@@ -76,6 +88,10 @@ class Learner(object):
     def get_name(self):
         return self._name
     
+    # return the optional phases used by the learner (see _phases)
+    def get_phases(self):
+        return self._phases
+    
     # return the current state of the learner within the environment
     def get_state(self):
         return self._state
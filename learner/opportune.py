@@ -4,15 +4,22 @@ Created on 17/11/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 from learner import Learner
+from learner import ACT_PHASES
 
 from itertools import chain, combinations
 import collections
-import copy
-from scipy import stats
+import math
+import weakref
 
 class OPPORTUNE(Learner):
     
-    def __init__(self, name, env, starting_state, goal_state, alpha, gamma, Emax, exp_strategy, N, OCL):
+    # only feedback1 is used among the feedback phases
+    _phases = ACT_PHASES + ['feedback1']
+    
+    #if reward_window is given, the variation of the rewards of each state-action
+    #pair (see __increase_joint_state_action) is computed over the last
+    #reward_window rewards only, rather than over all of them (see RewardStats)
+    def __init__(self, name, env, starting_state, goal_state, alpha, gamma, Emax, exp_strategy, N, OCL, reward_window=None):
         
         super(OPPORTUNE, self).__init__(name, env, self)
         
@@ -27,6 +34,8 @@ class OPPORTUNE(Learner):
         
         self._N = list(N) #_N must be and remain ordered
         
+        self._reward_window = reward_window
+        
         self._OCL = OCL # the communication layer with other learners
         self._OCL.register_learner(self._name, self)
         
@@ -55,7 +64,7 @@ class OPPORTUNE(Learner):
     #are populated. The other entries are populated on the fly.
     def _initialise_Q_table(self):
         self._QTable = {} # Q-table
-        self._RTable = {} # history rewards table
+        self._RTable = {} # history rewards table (running statistics, see RewardStats)
         
         #actions = {}
         #for a in self._env.get_state_actions(self._starting_state):
@@ -82,7 +91,7 @@ class OPPORTUNE(Learner):
             for a in self._env.get_state_actions(state):
                 v = JointAction({self._name : a})
                 A[v] = 0.0
-                AR[v] = []
+                AR[v] = RewardStats(self._reward_window)
             
             self._QTable[S] = A
             self._RTable[S] = AR
@@ -151,7 +160,7 @@ class OPPORTUNE(Learner):
             
             # update the perception of the joint state
             for neighbourID in self._S:
-                self._S.update_state(neighbourID, self._OCL.get_learner(neighbourID)._state)
+                self._S = self._S.with_state(neighbourID, self._OCL.get_learner(neighbourID)._state)
             
             #--------------------------------------------------------------
             # find a subset of _S that is in the Q table
@@ -336,28 +345,29 @@ class OPPORTUNE(Learner):
         if action not in self._QTable[state]:
             self.__check_and_create_Q_table_entry(state)
             self._QTable[state][action] = 0.0
-            self._RTable[state][action] = [] 
+            self._RTable[state][action] = RewardStats(self._reward_window)
     
     def __increase_joint_state_action(self, S, A):
         
-        if len(self._RTable[S][A]) > 0 and sum(self._RTable[S][A]) > 0 and stats.variation(self._RTable[S][A]) > self._Emax:
-            Saux = S.clone()
+        R = self._RTable[S][A]
+        if len(R) > 0 and R.get_sum() > 0 and R.get_variation() > self._Emax:
+            Saux = S
             
             if len(Saux.get_learners()) != len(self._N) + 1:
                 #while len(Saux.get_lerners()) == len(S.get_lerners()) or len(Saux.get_lerners()) < self._N + 1:
                 for neighbourID in self._N:
                     if neighbourID not in Saux.get_learners():
-                        Saux.update_state(neighbourID, self._OCL.get_learner(neighbourID)._feedback_state)
+                        Saux = Saux.with_state(neighbourID, self._OCL.get_learner(neighbourID)._feedback_state)
                         S = Saux
                         self.__check_and_create_Q_table_entry(S)
                         break
         else:
-            Aaux = A.clone()
+            Aaux = A
             
             if len(Aaux.get_learners()) != len(self._N) + 1:
                 for neighbourID in self._N:
                     if neighbourID not in Aaux.get_learners():
-                        Aaux.update_action(neighbourID, self._OCL.get_learner(neighbourID)._feedback_action)
+                        Aaux = Aaux.with_action(neighbourID, self._OCL.get_learner(neighbourID)._feedback_action)
                         A = Aaux
                         break
         
@@ -433,9 +443,9 @@ class OPPORTUNE(Learner):
                         max_S_v = m
         
         # update the found state
-        self._feedback_new_S = max_S.clone()
-        for neighbourID in self._feedback_new_S.get_learners():
-            self._feedback_new_S.update_state(neighbourID, self._OCL.get_learner(neighbourID)._feedback_new_state)
+        self._feedback_new_S = max_S
+        for neighbourID in max_S.get_learners():
+            self._feedback_new_S = self._feedback_new_S.with_state(neighbourID, self._OCL.get_learner(neighbourID)._feedback_new_state)
         
         # check whether new_state is already in Q-table
         self.__check_and_create_Q_table_entry(self._feedback_new_S)
@@ -468,7 +478,7 @@ class OPPORTUNE(Learner):
                         if ac in self._QTable[st].keys():
                             
                             self._QTable[st][ac] += self._alpha * (reward + self._gamma * max_new_r - self._QTable[st][ac])
-                            self._RTable[st][ac].append(reward)
+                            self._RTable[st][ac].push(reward)
                             
                             
         
@@ -512,68 +522,156 @@ class OPPORTUNECommLayer(object):
     def get_learner(self, name):
         return self.__learners[name]
 
-class JointState(object):
-    def __init__(self, in_dict):
+class _JointKey(object):
+    '''
+    Base of JointState and JointAction, which are used as keys of the Q-table. 
+    A joint key is immutable and is stored as a tuple of (learner, value) pairs
+    sorted by learner, whose hash is computed once. Joint keys are interned: 
+    creating a joint key equal to an existing one returns the existing object 
+    (each subclass keeps its own interning table, whose entries are dropped 
+    when no longer referenced), so that equal keys are usually the same object 
+    and their comparison is cheap.
+    '''
+    
+    __slots__ = ('_items', '_dict', '_hash', '__weakref__')
+    
+    # the interning table of each subclass, in the form {items: joint key}
+    _interned = None
+    
+    def __new__(cls, in_dict):
         '''
-        A joint state is a dictionary, where keys and values represent, 
-        respectively, the learners and their respective states. 
+        in_dict is a dictionary, where keys and values represent, respectively, 
+        the learners and their respective values (states or actions). 
         '''
-        self._dict = copy.deepcopy(in_dict)
-    
-    def update_state(self, learner, state):
-        self._dict[learner] = state
+        items = tuple(sorted(in_dict.iteritems()))
+        try:
+            return cls._interned[items]
+        except KeyError:
+            self = object.__new__(cls)
+            self._items = items
+            self._dict = dict(items)
+            self._hash = hash(items)
+            cls._interned[items] = self
+            return self
+    
+    # return a joint key equal to this one, but with the given value for the
+    # given learner (the learner is added if not present)
+    def _with(self, learner, value):
+        d = dict(self._items)
+        d[learner] = value
+        return self.__class__(d)
     
     def get_learners(self):
-        return self._dict.keys()
+        return [learner for learner, _ in self._items]
     
-    def get_state(self, learner):
-        return self._dict[learner]
+    def __iter__(self):
+        return iter(self.get_learners())
     
     def __hash__(self):
-        return hash(self.__str__())
+        return self._hash
     
     def __eq__(self, other):
-        return self._dict == other._dict
+        return self is other or (type(self) is type(other) and self._hash == other._hash and self._items == other._items)
+    
+    def __ne__(self, other):
+        return not self == other
     
     def __len__(self):
-        return len(self._dict)
+        return len(self._items)
     
     def __str__(self):
-        od = collections.OrderedDict(self._dict)
-        return str(od)[12:-1]
+        return str(list(self._items))
     
-    def clone(self):
-        return JointState(self._dict)
+    def __reduce__(self):
+        return (self.__class__, (self._dict,))
     
-class JointAction(object):
-    def __init__(self, in_dict):
-        '''
-        A joint action is a dictionary, where keys and values represent, 
-        respectively, the learners and their respective actions. 
-        '''
-        self._dict = copy.deepcopy(in_dict)
+class JointState(_JointKey):
+    '''
+    A joint state, where the values are the learners' states (see _JointKey). 
+    '''
     
-    def update_action(self, learner, action):
-        self._dict[learner] = action
+    __slots__ = ()
     
-    def get_learners(self):
-        return self._dict.keys()
+    _interned = weakref.WeakValueDictionary()
     
-    def get_action(self, learner):
+    # return the joint state with the given learner's state replaced (joint
+    # states are immutable)
+    def with_state(self, learner, state):
+        return self._with(learner, state)
+    
+    def get_state(self, learner):
         return self._dict[learner]
     
-    def __hash__(self):
-        return hash(self.__str__())
+class JointAction(_JointKey):
+    '''
+    A joint action, where the values are the learners' actions (see _JointKey). 
+    '''
     
-    def __eq__(self, other):
-        return self._dict == other._dict
+    __slots__ = ()
     
-    def __len__(self):
-        return len(self._dict)
+    _interned = weakref.WeakValueDictionary()
     
-    def __str__(self):
-        od = collections.OrderedDict(self._dict)
-        return str(od)[12:-1]
+    # return the joint action with the given learner's action replaced (joint
+    # actions are immutable)
+    def with_action(self, learner, action):
+        return self._with(learner, action)
+    
+    def get_action(self, learner):
+        return self._dict[learner]
+
+class RewardStats(object):
+    def __init__(self, window=None):
+        '''
+        Running statistics of the rewards received by a state-action pair, 
+        which replace the list of all such rewards: the number of rewards, 
+        their sum and mean, and the sum of squared deviations from the mean 
+        (M2), updated in O(1) per reward with Welford's algorithm. The 
+        variation (std/mean) is thus obtained in O(1) and equals that of 
+        scipy.stats.variation on the list of rewards (i.e., with the 
+        population standard deviation).
+        If window is given, only the last window rewards are considered, 
+        where the oldest reward is removed (by reversing its Welford update) 
+        whenever a new one exceeds the window.
+        '''
+        self._window = window
+        self._rewards = collections.deque() if window else None
+        
+        self._n = 0
+        self._sum = 0
+        self._mean = 0.0
+        self._M2 = 0.0
+    
+    def push(self, reward):
+        self._n += 1
+        self._sum += reward
+        delta = reward - self._mean
+        self._mean += delta / self._n
+        self._M2 += delta * (reward - self._mean)
+        
+        if self._window:
+            self._rewards.append(reward)
+            if self._n > self._window:
+                self.__pop(self._rewards.popleft())
+    
+    def __pop(self, reward):
+        self._n -= 1
+        self._sum -= reward
+        if self._n == 0:
+            self._mean = 0.0
+            self._M2 = 0.0
+            return
+        delta = reward - self._mean
+        self._mean -= delta / self._n
+        self._M2 = max(self._M2 - delta * (reward - self._mean), 0.0)
+    
+    def get_sum(self):
+        return self._sum
+    
+    def get_mean(self):
+        return self._mean
+    
+    def get_variation(self):
+        return math.sqrt(self._M2 / self._n) / self._mean
     
-    def clone(self):
-        return JointAction(self._dict)
\ No newline at end of file
+    def __len__(self):
+        return self._n
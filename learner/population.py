@@ -0,0 +1,283 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+from learner import Learner
+from learner import qtable
+import numpy as np
+from itertools import izip
+
+# Population of homogeneous Q-learners (eg, the drivers of a route choice
+# scenario), whose decisions and updates are made in a vectorised fashion for
+# whole batches of agents, rather than through one QLearner object per agent.
+# The Q-values of all agents are stacked in a single matrix, with one row per
+# pair (agent, state) visited so far (the rows are created on the fly, as in
+# QLearner) and one column per action; the states and actions are interned by
+# the environment's StateActionIndex (see learner/qtable.py).
+#
+# Each agent is registered to the environment as a PopulationMember, which
+# implements the Learner interface (so that the population can be used in
+# place of individual learners), but the environments are expected to process
+# the members of a population in batches (see Environment.act_last_batch and
+# Environment.feedback_last_batch).
+
+class PopulationQLearner(object):
+
+    def __init__(self, names, env, starting_states, goal_states, alpha, gamma, exp_strategy, initial_rows=1024):
+
+        self._env = env
+        self._index = qtable.get_index(env)
+
+        self._n = len(names)
+        self._starting_states = list(starting_states)
+        self._goal_states = list(goal_states)
+
+        self._exp_strategy = exp_strategy
+
+        self._alpha = alpha
+        self._gamma = gamma
+
+        # the Q-values, where _rows[sid * n + i] is the row of the i-th agent in
+        # the state with ID sid (n being the number of agents); the state ID of
+        # each row, its number of actions and whether it is an ending state
+        # (see feedback_last_batch) are also kept
+        self._rows = {}
+        self._Q = np.zeros((initial_rows, 1))
+        self._row_state = np.zeros(initial_rows, dtype=int)
+        self._row_n_actions = np.zeros(initial_rows, dtype=int)
+        self._row_ending = np.zeros(initial_rows, dtype=bool)
+        self._size = 0
+
+        # the members of the population (one per agent), registered to the environment
+        self._members = [PopulationMember(name, env, self, i) for i, name in enumerate(names)]
+
+        # the Q-table entries corresponding to the initial states are created
+        # in the beginning; the other entries are populated on the fly
+        self._starting_rows = self.__get_rows(range(self._n), self._starting_states)
+
+        self._episode = None
+        self.reset_episodic(0)
+
+    # return the members of the population
+    def get_members(self):
+        return self._members
+
+    # reset all episode-related attributes of all agents; the current state of
+    # each agent is given by its current row (see __init__)
+    def reset_episodic(self, episode):
+        self._episode = episode
+
+        self._row = self._starting_rows.copy()
+        self._action = [None] * self._n
+        self._accumulated_reward = np.zeros(self._n)
+        self._has_arrived = np.zeros(self._n, dtype=bool)
+
+        self._exp_strategy.reset_episodic()
+
+    # reset the episode-related attributes of the i-th agent; as the agents are
+    # reset together (see Environment.reset_episode), all of them are reset on
+    # the first call of each episode
+    def reset_member(self, i, episode):
+        if episode != self._episode:
+            self.reset_episodic(episode)
+
+    # return the rows of the given agents in the given states, creating those
+    # that do not exist yet (the Q-values are initialised with 0)
+    def __get_rows(self, agents, states):
+        ids = self._index._ids
+        n = self._n
+        rows = [self._rows.get(ids.get(s, -1) * n + i, -1) for i, s in izip(agents, states)]
+        for k, row in enumerate(rows):
+            if row < 0:
+                rows[k] = self.__create_row(agents[k], states[k])
+        return np.array(rows, dtype=int)
+
+    # create the row of the given agent and state
+    def __create_row(self, i, state):
+        sid = self._index.get_id(state)
+        key = sid * self._n + i
+        if key in self._rows: # the state was known but not the row
+            return self._rows[key]
+        actions = self._index.get_actions(sid)
+
+        # grow the matrix (doubling its number of rows and/or increasing its
+        # number of columns) if necessary
+        rows, cols = self._Q.shape
+        if self._size == rows or len(actions) > cols:
+            if self._size == rows:
+                rows *= 2
+            Q = np.zeros((rows, max(len(actions), cols)))
+            Q[:self._size, :cols] = self._Q[:self._size]
+            self._Q = Q
+            for name in ['_row_state', '_row_n_actions', '_row_ending']:
+                old = getattr(self, name)
+                new = np.zeros(rows, dtype=old.dtype)
+                new[:self._size] = old[:self._size]
+                setattr(self, name, new)
+
+        row = self._size
+        self._rows[key] = row
+        self._row_state[row] = sid
+        self._row_n_actions[row] = len(actions)
+        self._row_ending[row] = state == self._goal_states[i] or not actions or not actions[0]
+        self._size += 1
+        return row
+
+    # let the given agents (their positions in the population) choose their
+    # actions in the given states (None for their current states), among the
+    # given available actions (None if all actions are available); the
+    # choices are made at once, and a list with the pair [state, action] of
+    # each agent is returned
+    def act_last_batch(self, agents, states=None, available_actions=None):
+        agents = np.asarray(agents, dtype=int)
+
+        # the rows of the agents' states
+        rows = self._row[agents]
+        if states is not None and any(s is not None for s in states):
+            given = [k for k, s in enumerate(states) if s is not None]
+            rows[given] = self.__get_rows(agents[given].tolist(), [states[k] for k in given])
+
+        # the available actions of each row
+        valid = np.arange(self._Q.shape[1]) < self._row_n_actions[rows][:, np.newaxis]
+        if available_actions is not None:
+            for k, available in enumerate(available_actions):
+                if available is not None:
+                    sid = self._row_state[rows[k]]
+                    valid[k] = False
+                    valid[k, [self._index.get_position(sid, a) for a in available]] = True
+
+        # choose the actions according to the exploration strategy (the agents
+        # without available actions have reached an ending state)
+        choices = self._exp_strategy.choose_batch(self._Q[rows], valid, self._episode)
+        self._has_arrived[agents[choices < 0]] = True
+
+        states = [self._index._states[sid] for sid in self._row_state[rows].tolist()]
+        ret = []
+        for i, state, sid, choice in izip(agents.tolist(), states, self._row_state[rows].tolist(), choices.tolist()):
+            if choice >= 0:
+                self._action[i] = self._index._actions[sid][choice]
+            ret.append([state, self._action[i]])
+
+        return ret
+
+    # send to the given agents the feedback of their actions (see QLearner.feedback_last),
+    # where the rewards and the new states are given for each agent, as well as
+    # its previous state and action (None for the agent's current ones); the
+    # Q-values of all agents are updated at once (each agent may appear only
+    # once in the batch)
+    def feedback_last_batch(self, agents, rewards, new_states, prev_states=None, prev_actions=None):
+        agents = np.asarray(agents, dtype=int)
+
+        # the rows of the previous and the new states
+        rows = self._row[agents]
+        if prev_states is not None and any(s is not None for s in prev_states):
+            given = [k for k, s in enumerate(prev_states) if s is not None]
+            rows[given] = self.__get_rows(agents[given].tolist(), [prev_states[k] for k in given])
+        new_rows = self.__get_rows(agents.tolist(), new_states)
+
+        # the columns of the actions
+        if prev_actions is None:
+            prev_actions = [None] * len(agents)
+        positions = self._index._positions
+        cols = np.array([positions[sid][self._action[i] if a is None else a] for i, sid, a in izip(agents.tolist(), self._row_state[rows].tolist(), prev_actions)], dtype=int)
+
+        # the greatest Q-value of each new state (0 if the state has no actions)
+        valid = np.arange(self._Q.shape[1]) < self._row_n_actions[new_rows][:, np.newaxis]
+        maxfuture = np.where(valid, self._Q[new_rows], -np.inf).max(axis=1)
+        maxfuture[~valid.any(axis=1)] = 0.0
+
+        # update the Q-table
+        rewards = np.asarray(rewards, dtype=float)
+        self._Q[rows, cols] += self._alpha * (rewards + self._gamma * maxfuture - self._Q[rows, cols])
+
+        # update the agents' states and accumulated rewards, and check whether
+        # an ending state has been reached
+        self._row[agents] = new_rows
+        self._accumulated_reward[agents] += rewards
+        self._has_arrived[agents] |= self._row_ending[new_rows]
+
+    # return the current state of the i-th agent
+    def get_state(self, i):
+        return self._index.get_state(self._row_state[self._row[i]])
+
+    # return whether the i-th agent has reached an ending state
+    def has_arrived(self, i):
+        return self._has_arrived[i]
+
+    # return the Q-values of the i-th agent as a dictionary ({state: {action:
+    # Q-value}}), as in QLearner
+    def get_QTable(self, i):
+        ret = {}
+        for key, row in self._rows.iteritems():
+            if key % self._n == i:
+                actions = self._index.get_actions(key / self._n)
+                ret[self._index.get_state(key / self._n)] = dict(zip(actions, self._Q[row, :len(actions)].tolist()))
+        return ret
+
+# A member (agent) of a PopulationQLearner, which is registered to the environment
+# as an individual learner; all calls are forwarded to the population
+class PopulationMember(Learner):
+
+    # act1-act4 and feedback1-feedback3 are not used
+    _phases = []
+
+    def __init__(self, name, env, population, i):
+
+        # (set before registering to the environment, see Environment.register_learner)
+        self._population = population
+        self._i = i
+
+        super(PopulationMember, self).__init__(name, env, self)
+
+    # return the population of the member and the member's position in it
+    def get_population(self):
+        return self._population, self._i
+
+    def reset_all(self):
+        #nothing to do here (instead of reset_all, the population could be recreated)
+        pass
+
+    def reset_episodic(self, episode):
+        super(PopulationMember, self).reset_episodic(episode)
+        self._population.reset_member(self._i, episode)
+
+    def act1(self, state=None, available_actions=None):
+        # not necessary in this algorithm
+        pass
+
+    def act2(self, state=None, available_actions=None):
+        # not necessary in this algorithm
+        pass
+
+    def act3(self, state=None, available_actions=None):
+        # not necessary in this algorithm
+        pass
+
+    def act4(self, state=None, available_actions=None):
+        # not necessary in this algorithm
+        pass
+
+    def act_last(self, state=None, available_actions=None):
+        return self._population.act_last_batch([self._i], [state], [available_actions])[0]
+
+    def feedback1(self, reward, new_state, prev_state=None, prev_action=None):
+        # not necessary in this algorithm
+        pass
+
+    def feedback2(self, reward, new_state, prev_state=None, prev_action=None):
+        # not necessary in this algorithm
+        pass
+
+    def feedback3(self, reward, new_state, prev_state=None, prev_action=None):
+        # not necessary in this algorithm
+        pass
+
+    def feedback_last(self, reward, new_state, prev_state=None, prev_action=None):
+        self._population.feedback_last_batch([self._i], [reward], [new_state], [prev_state], [prev_action])
+
+    def get_state(self):
+        return self._population.get_state(self._i)
+
+    def has_arrived(self):
+        return self._population.has_arrived(self._i)
@@ -4,10 +4,16 @@ Created on 04/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 from learner import Learner
+from learner.qtable import ArrayQTable
 
 class QLearner(Learner):
     
-    def __init__(self, name, env, starting_state, goal_state, alpha, gamma, exp_strategy):
+    # act1-act4 and feedback1-feedback3 are not used in this algorithm
+    _phases = []
+    
+    #if array_qtable is True, the Q-table is stored in an ArrayQTable (see
+    #learner/qtable.py), rather than in a dictionary of dictionaries
+    def __init__(self, name, env, starting_state, goal_state, alpha, gamma, exp_strategy, array_qtable=False):
         
         super(QLearner, self).__init__(name, env, self)
         
@@ -19,6 +25,7 @@ class QLearner(Learner):
         self._alpha = alpha
         self._gamma = gamma
         
+        self._array_qtable = array_qtable
         self._initialise_Q_table()
         
         self.reset_episodic(0)
@@ -27,6 +34,11 @@ class QLearner(Learner):
     #in the beginning, only the entries corresponding to initial state
     #are populated. The other entries are populated on the fly.
     def _initialise_Q_table(self):#TODO - replace by __check_and_create_Q_table_entry
+        if self._array_qtable:
+            self._QTable = ArrayQTable(self._env)
+            self._QTable.get_entry(self._starting_state)
+            return
+        
         self._QTable = {}
         
         self._QTable[self._starting_state] = dict({a:0 for a in self._env.get_state_actions(self._starting_state)})
@@ -64,6 +76,9 @@ class QLearner(Learner):
     
     def act_last(self, state=None, available_actions=None):
         
+        if self._array_qtable:
+            return self.__act_last_array(state, available_actions)
+        
         #the state may be passed as parameter if the reasoning is not being made
         #regarding the current state (as is the case in SUMO env, eg)
         if state == None:
@@ -92,6 +107,23 @@ class QLearner(Learner):
         #return action to take
         return [state, self._action]
     
+    #act_last with the array-backed Q-table (the state's entry is created on the
+    #fly by the Q-table itself)
+    def __act_last_array(self, state, available_actions):
+        if state == None:
+            state = self._state
+        
+        actions, values = self._QTable.get_actions_values(state, available_actions)
+        
+        if not actions:
+            self._has_arrived = True
+        else:
+            #choose action according to the the exploration strategy
+            self._action = actions[self._exp_strategy.choose_index(values, self._episode)]
+        
+        #return action to take
+        return [state, self._action]
+    
     #check whether the given state is already in the Q-table, if not, create it
     #PS: as the Q-table is created on-the-fly, some states may not be in the table yet
     def __check_and_create_Q_table_entry(self, state):
@@ -129,6 +161,10 @@ class QLearner(Learner):
         
         #print "After performing action %s in state %s, the new state is %s and the reward %f" % (action, state, new_state, reward)
         
+        if self._array_qtable:
+            self.__feedback_last_array(reward, new_state, state, action)
+            return
+        
         #check whether new_state is already in Q-table
         self.__check_and_create_Q_table_entry(state)
         self.__check_and_create_Q_table_entry(new_state)
@@ -140,12 +176,8 @@ class QLearner(Learner):
                 maxfuture = max(self._QTable[new_state].values())
             
             self._QTable[state][action] += self._alpha * (reward + self._gamma * maxfuture - self._QTable[state][action])
-        except Exception, e:
-            print "Nooooooooooooooooooooooooo!!!!"
-            #print new_state
-            #print self._env.get_state_actions(new_state)
-            #print self._QTable
-            #print str(e)
+        except KeyError:
+            raise Exception('Action %s is not available in state %s (learner %s)!' % (action, state, self._name))
         
         #update curr_state = new_state
         self._state = new_state
@@ -160,6 +192,25 @@ class QLearner(Learner):
         if new_state == self._goal_state or not self._QTable[new_state].keys()[0]:
             self._has_arrived = True
         
+    #feedback_last with the array-backed Q-table
+    def __feedback_last_array(self, reward, new_state, state, action):
+        
+        #update Q table with cur_state and action
+        try:
+            actions = self._QTable.update(state, action, reward, new_state, self._alpha, self._gamma)
+        except KeyError:
+            raise Exception('Action %s is not available in state %s (learner %s)!' % (action, state, self._name))
+        
+        #update curr_state = new_state
+        self._state = new_state
+        
+        #update accumulated reward
+        self._accumulated_reward += reward
+        
+        #check whether an ending state has been reached
+        if new_state == self._goal_state or not actions or not actions[0]:
+            self._has_arrived = True
+        
     def has_arrived(self):
         return self._has_arrived
 
@@ -0,0 +1,147 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+import weakref
+import array
+
+# Array-backed Q-table. Rather than a dictionary of dictionaries (one entry per
+# state, each with one entry per action), the Q-values of a learner are stored
+# in a single (growable) float array, where the actions of each state occupy a
+# contiguous slice. The states and their actions are interned to integer IDs by
+# a StateActionIndex, which is shared by all learners of the same environment
+# (see get_index), so that each learner keeps only the offsets of its states and
+# their Q-values. As in the dictionary version, the entries of the states are
+# created on the fly (i.e., when the states are visited for the first time).
+
+# the indices of the environments (see get_index)
+_indices = weakref.WeakKeyDictionary()
+
+# return the StateActionIndex of the given environment (created on the first call)
+def get_index(env):
+    if env not in _indices:
+        _indices[env] = StateActionIndex(env)
+    return _indices[env]
+
+# Interning of the states of an environment (and of the actions available in
+# them, as given by env.get_state_actions), where each state is assigned an
+# integer ID and each action is identified by its position within its state
+class StateActionIndex(object):
+
+    def __init__(self, env):
+        self._env = env
+
+        self._ids = {}        # state -> ID
+        self._states = []     # ID -> state
+        self._actions = []    # ID -> tuple with the state's actions
+        self._positions = []  # ID -> {action: position}
+
+    # return the ID of the given state (the state is registered if it is not
+    # yet known)
+    def get_id(self, state):
+        try:
+            return self._ids[state]
+        except KeyError:
+            actions = tuple(self._env.get_state_actions(state))
+            self._ids[state] = len(self._actions)
+            self._states.append(state)
+            self._actions.append(actions)
+            self._positions.append(dict([(a, i) for i, a in enumerate(actions)]))
+            return self._ids[state]
+
+    # return the state with the given ID
+    def get_state(self, sid):
+        return self._states[sid]
+
+    # return the actions of the state with the given ID
+    def get_actions(self, sid):
+        return self._actions[sid]
+
+    # return the position of the given action among those of the state with the given ID
+    def get_position(self, sid, action):
+        return self._positions[sid][action]
+
+class ArrayQTable(object):
+
+    def __init__(self, env):
+        self._index = get_index(env)
+
+        # the offset of the Q-values of each state (i.e., of the first of its
+        # actions) in _values, in the form {state: offset}
+        self._offsets = {}
+        self._values = array.array('d')
+
+    # create the entry of the given state (the Q-values are initialised with 0)
+    def __create_entry(self, state):
+        n = len(self._index.get_actions(self._index.get_id(state)))
+        self._offsets[state] = len(self._values)
+        self._values.extend([0.0] * n)
+
+    # return the state's ID and the offset of its Q-values (see __init__),
+    # creating the state's entry if it does not exist yet
+    def get_entry(self, state):
+        if state not in self._offsets:
+            self.__create_entry(state)
+        return self._index._ids[state], self._offsets[state]
+
+    # return the actions of the given state and their Q-values (as lists); if
+    # available_actions is given, only such actions are returned
+    def get_actions_values(self, state, available_actions=None):
+        try:
+            offset = self._offsets[state]
+        except KeyError:
+            self.__create_entry(state)
+            offset = self._offsets[state]
+        sid = self._index._ids[state]
+        actions = self._index._actions[sid]
+        if available_actions is None:
+            return actions, self._values[offset:offset + len(actions)].tolist()
+        positions = self._index._positions[sid]
+        values = self._values
+        return available_actions, [values[offset + positions[a]] for a in available_actions]
+
+    # return the Q-value of the given state-action pair
+    def get_value(self, state, action):
+        sid, offset = self.get_entry(state)
+        return self._values[offset + self._index._positions[sid][action]]
+
+    # return the greatest Q-value of the given state (0 if it has no actions)
+    def get_max_value(self, state):
+        sid, offset = self.get_entry(state)
+        n = len(self._index._actions[sid])
+        if n == 0:
+            return 0.0
+        return max(self._values[offset:offset + n])
+
+    # Q-learning update of the given state-action pair:
+    # Q(s,a) += alpha * (reward + gamma * max_a' Q(s',a') - Q(s,a));
+    # the actions of new_state are returned
+    def update(self, state, action, reward, new_state, alpha, gamma):
+        offsets = self._offsets
+        if new_state not in offsets:
+            self.__create_entry(new_state)
+        if state not in offsets:
+            self.__create_entry(state)
+        ids = self._index._ids
+
+        values = self._values
+        actions = self._index._actions[ids[new_state]]
+        maxfuture = 0.0
+        if actions:
+            offset = offsets[new_state]
+            maxfuture = max(values[offset:offset + len(actions)])
+
+        i = offsets[state] + self._index._positions[ids[state]][action]
+        q = values[i]
+        values[i] = q + alpha * (reward + gamma * maxfuture - q)
+        return actions
+
+    # return the table as a dictionary of dictionaries ({state: {action: Q-value}}),
+    # as in the dictionary version of the Q-table
+    def to_dict(self):
+        ret = {}
+        for state in self._offsets:
+            actions, values = self.get_actions_values(state)
+            ret[state] = dict(zip(actions, values))
+        return ret
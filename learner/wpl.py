@@ -8,6 +8,9 @@ from tools import sampling
 
 class WPL(Learner):
     
+    # act1-act4 and feedback1-feedback3 are not used in this algorithm
+    _phases = []
+    
     def __init__(self, name, env, starting_state, goal_state, eta=0.002, alpha=0.1, gamma=0.999, epsilon=0.0001):
         
         super(WPL, self).__init__(name, env, self)
@@ -4,6 +4,7 @@ Created on 04/08/2014
 @author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
 '''
 import sys#@UnusedImport
+import os
 
 import environment as Env
 import environment.NFG as NFG
@@ -11,10 +12,12 @@ from environment.cliffwalking import CliffWalking
 from environment.sumo import SUMO
 from environment.sumo import SUMORouteChoice
 from environment.sumotl import SUMOTrafficLights
+from environment.macro import MacroRouteChoice
 
 from environment.NFG.twoplayer_twoaction import TwoPlayerTwoAction
 
 from learner.q_learning import QLearner
+from learner.population import PopulationQLearner
 from learner.wpl import WPL
 from learner.opportune import *#@UnusedWildImport
 
@@ -22,11 +25,19 @@ from exploration.epsilon_greedy import EpsilonGreedy
 from exploration.boltzmann import Boltzmann
 
 import tools.misc as misc#@UnusedImport
-import external.KSP as KSP
+from tools import sumobackend
+from tools import sumoxml
+from tools import experiments
+import external.KSP as KSP#@UnusedImport
 
 from itertools import *#@UnusedWildImport #chain, combinations
 
 import datetime
+import time
+import tempfile
+import random
+import numpy as np
+import sumolib
 
 
 
@@ -85,6 +96,54 @@ def test_SUMO():
         env.run_episode(50000)
         #print "%i\t%s\t%f" % (env._steps, learner._state, learner._accumulated_reward)
 
+def test_SUMO_open_files():
+    
+    # regression test: running episodes must not leak file descriptors (eg,
+    # the null device used to suppress the output of TraCI in run_episode);
+    # the files opened by environment/sumo.py are tracked (which also keeps
+    # them referenced, so that they are not closed by the garbage collector
+    # in place of the environment), and all of them must have been closed
+    import environment.sumo as sumo_module
+    opened = []
+    def tracking_open(*args, **kwargs):
+        f = open(*args, **kwargs)
+        opened.append(f)
+        return f
+    
+    # number of files currently open by this process
+    def count_open_files():
+        return len(os.listdir('/proc/self/fd'))
+    
+    #a SUMO environment, with a learner for each vehicle
+    env = SUMO('nets/OW/OW-traci.sumocfg', 8813, False)
+    exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+    for vehID in env.get_vehicles_ID_list():
+        vehDic = env.get_vehicle_dict(vehID)
+        _ = QLearner(vehID, env, vehDic['origin'], vehDic['destination'], 0.3, 0.9, exp)
+    
+    sumo_module.open = tracking_open
+    try:
+        #the redirect target must be open within the redirected block only
+        before = count_open_files()
+        with env.redirected():
+            during = count_open_files()
+            assert not opened[-1].closed
+        assert opened[-1].closed, 'the redirect target was not closed'
+        assert during == before + 1 and count_open_files() == before, 'file descriptors leaked by redirected()'
+        
+        #the number of open files must not change from one episode to another
+        open_files = []
+        for _ in xrange(3):
+            env.run_episode(50000)
+            open_files.append(count_open_files())
+    finally:
+        del sumo_module.open
+    
+    print 'open files after each episode: %s' % open_files
+    leaked = [f.name for f in opened if not f.closed]
+    assert not leaked, 'files left open: %s' % leaked
+    assert len(set(open_files)) == 1, 'file descriptors leaked along the episodes'
+
 def test_SUMORouteChoice():
     
     # a SUMO environment
@@ -96,11 +155,8 @@ def test_SUMORouteChoice():
     # create a set of routes for each OD-pair (through KSP algorithm),
     # and define one such set for each OD-pair (these sets will correspond 
     # to the actions available on each state)
-    pairs = env.get_OD_pairs()
-    for origin, destination in pairs:
-        RKSP = KSP.getKRoutesNetFile('nets/OW/OW_for_KSP.net', origin, destination, 4)
-        routes = [" ".join(r[0]) for r in RKSP]
-        env.set_routes_OD_pair(origin, destination, routes)
+    # (the routes are cached, so they are computed only in the first run)
+    env.set_routes_KSP('nets/OW/OW_for_KSP.net', 4)
     
     # an exploration strategy
     exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
@@ -126,7 +182,268 @@ def test_SUMORouteChoice():
     for _ in xrange(n_episodes):
         env.run_episode(50000)
         #print env._learners['1.0']._QTable
+
+def test_MacroRouteChoice():
+    
+    # a macroscopic environment, with the vehicles of the SUMO route file and
+    # the links' cost functions of the KSP network file (BPR functions, so that
+    # the travel times depend on the links' flows, see tools.misc.convert_SUMO_to_KSP)
+    env = MacroRouteChoice('nets/OW/OW-traci.sumocfg', 'nets/OW/OW_for_KSP_BPR.net')
+    
+    # the set of routes of each OD-pair (as in test_SUMORouteChoice)
+    env.set_routes_KSP('nets/OW/OW_for_KSP_BPR.net', 4)
+    
+    # an exploration strategy
+    exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+    
+    # for each vehicle in the route file
+    for vehID in env.get_vehicles_ID_list():
+        vehDic = env.get_vehicle_dict(vehID)
+        
+        # the origin is an encoding of the OD-pair (as in SUMORouteChoice)
+        origin = env.encode_OD(vehDic['origin'], vehDic['destination'])
+        
+        # create a learner
+        _ = QLearner(vehID, env, origin, vehDic['destination'], 0.8, 0.9, exp)
+    
+    # number of episodes (much cheaper than in SUMO)
+    n_episodes = 10000
+    
+    print 'ep\tavg tt\truntime'
+    
+    # for each episode
+    for _ in xrange(n_episodes):
+        env.run_episode()
+
+# check that the travel times of MacroRouteChoice depend on the links' flows:
+# after an episode, the cost of each link must be given by its BPR function
+# evaluated on the number of vehicles whose routes include it, and the travel
+# time of each vehicle must be the sum of the costs of its route's links
+def test_MacroRouteChoice_congestion():
+    
+    random.seed(1)
+    
+    env = MacroRouteChoice('nets/OW/OW-traci.sumocfg', 'nets/OW/OW_for_KSP_BPR.net')
+    env.set_routes_KSP('nets/OW/OW_for_KSP_BPR.net', 4)
+    
+    exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+    for vehID in env.get_vehicles_ID_list():
+        vehDic = env.get_vehicle_dict(vehID)
+        origin = env.encode_OD(vehDic['origin'], vehDic['destination'])
+        _ = QLearner(vehID, env, origin, vehDic['destination'], 0.8, 0.9, exp)
+    
+    env.run_episode()
+    
+    # the flow of each link, given the routes chosen by the vehicles
+    routes = dict((vehID, env._learners[vehID]._action.split(' ')) for vehID in env.get_vehicles_ID_list())
+    flows = {}
+    for links in routes.values():
+        for link in links:
+            flows[link] = flows.get(link, 0) + 1
+    
+    # the cost of each link under such flows
+    costs = {}
+    congested = 0
+    for edge in env.get_graph().E:
+        fftt, cap = edge.constants['fftt'], edge.constants['cap']
+        expected = fftt * (1 + 0.15 * (flows.get(edge.name, 0) / cap) ** 4)
+        assert abs(edge.cost - expected) <= 1e-9 * max(1.0, expected), 'cost of link %s does not match its flow' % edge.name
+        costs[edge.name] = edge.cost
+        if edge.cost > fftt:
+            congested += 1
+    assert congested > 0, 'no link is congested'
+    
+    # the travel time of each vehicle
+    for vehID, links in routes.items():
+        tt = env.get_vehicle_dict(vehID)['travel_time']
+        assert abs(tt - sum(costs[link] for link in links)) <= 1e-9 * tt, 'travel time of vehicle %s does not match its route' % vehID
+    
+    print '%d of %d links congested' % (congested, len(costs))
+
+# compare the dictionary and the array-backed (see learner/qtable.py) Q-tables
+# of QLearner in the MacroRouteChoice setting (see test_MacroRouteChoice): the
+# Q-values after replaying the same transitions and the time per update
+def test_ArrayQTable():
+    
+    n_episodes = 100
+    
+    random.seed(1)
+    
+    env = MacroRouteChoice('nets/OW/OW-traci.sumocfg', 'nets/OW/OW_for_KSP_BPR.net')
+    env.set_routes_KSP('nets/OW/OW_for_KSP_BPR.net', 4)
+    
+    exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+    
+    # the vehicles learn with dictionary-based Q-tables, and each transition is
+    # replayed on two shadow learners (one per Q-table implementation, each
+    # registered in an idle copy of the environment), so that both Q-tables
+    # receive exactly the same updates
+    shadows = {}
+    for array_qtable in [False, True]:
+        shadow_env = MacroRouteChoice('nets/OW/OW-traci.sumocfg', 'nets/OW/OW_for_KSP_BPR.net')
+        shadow_env.set_routes_KSP('nets/OW/OW_for_KSP_BPR.net', 4)
+        shadows[array_qtable] = {}
+        for vehID in env.get_vehicles_ID_list():
+            vehDic = env.get_vehicle_dict(vehID)
+            origin = env.encode_OD(vehDic['origin'], vehDic['destination'])
+            if not array_qtable:
+                _ = QLearner(vehID, env, origin, vehDic['destination'], 0.8, 0.9, exp)
+            shadows[array_qtable][vehID] = QLearner(vehID, shadow_env, origin, vehDic['destination'], 0.8, 0.9, exp, array_qtable=array_qtable)
+    
+    elapsed = {False: 0.0, True: 0.0}
+    n_updates = 0
+    for _ in xrange(n_episodes):
+        env.run_episode()
         
+        transitions = []
+        for vehID in env.get_vehicles_ID_list():
+            vehDic = env.get_vehicle_dict(vehID)
+            state = env.encode_OD(vehDic['origin'], vehDic['destination'])
+            transitions.append((vehID, -vehDic['travel_time'], state, state, env._learners[vehID]._action))
+        n_updates += len(transitions)
+        
+        for array_qtable in [False, True]:
+            learners = shadows[array_qtable]
+            start = time.time()
+            for vehID, reward, new_state, state, action in transitions:
+                learners[vehID].feedback_last(reward, new_state, state, action)
+            elapsed[array_qtable] += time.time() - start
+    
+    for array_qtable in [False, True]:
+        print 'array_qtable=%s: %f microseconds per update' % (array_qtable, elapsed[array_qtable] / n_updates * 1e6)
+    
+    # both Q-tables must hold exactly the same values
+    for vehID in env.get_vehicles_ID_list():
+        QTable = shadows[True][vehID]._QTable.to_dict()
+        assert QTable == shadows[False][vehID]._QTable, 'Q-tables of %s differ!' % vehID
+    print 'Q-tables match after %i updates' % n_updates
+
+# compare the running times of QLearner (one object per vehicle) and
+# PopulationQLearner (a single population with all vehicles) on MacroRouteChoice
+# (with the congestible network), as well as the travel times they converge to
+def test_PopulationQLearner():
+    
+    n_episodes = 300
+    n_last = 50
+    
+    results = {}
+    for population in [False, True]:
+        
+        random.seed(1)
+        np.random.seed(1)
+        
+        env = MacroRouteChoice('nets/OW/OW-traci.sumocfg', 'nets/OW/OW_for_KSP_BPR.net')
+        env.set_routes_KSP('nets/OW/OW_for_KSP_BPR.net', 4)
+        
+        exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+        
+        vehicles = env.get_vehicles_ID_list()
+        origins = []
+        destinations = []
+        for vehID in vehicles:
+            vehDic = env.get_vehicle_dict(vehID)
+            origins.append(env.encode_OD(vehDic['origin'], vehDic['destination']))
+            destinations.append(vehDic['destination'])
+        
+        if population:
+            _ = PopulationQLearner(vehicles, env, origins, destinations, 0.8, 0.9, exp)
+        else:
+            for vehID, origin, destination in zip(vehicles, origins, destinations):
+                _ = QLearner(vehID, env, origin, destination, 0.8, 0.9, exp)
+        
+        start = time.time()
+        avg_tt = []
+        for _ in xrange(n_episodes):
+            env.run_episode()
+            avg_tt.append(np.mean([env.get_vehicle_dict(vehID)['travel_time'] for vehID in vehicles]))
+        print 'population=%s: %f seconds' % (population, time.time() - start)
+        
+        # the learned behaviour must be the same: average travel time of the
+        # last episodes (once the exploration has decayed)
+        results[population] = np.mean(avg_tt[-n_last:])
+        print 'population=%s: average travel time of the first episode: %f, of the last %i episodes: %f' % (population, avg_tt[0], n_last, results[population])
+    
+    print 'relative difference: %f%%' % (abs(results[True] - results[False]) / results[False] * 100)
+
+# a single run of the SUMORouteChoice setting (see test_SUMORouteChoice), to be
+# used with experiments.run_experiments(...); the SUMO environment uses the given
+# port (and is kept running along the episodes if reuse_sumo is True), and the
+# average travel time (in minutes) of each episode is returned
+def experiment_SUMORouteChoice(port, alpha=0.8, gamma=0.9, n_episodes=100, seed=None, reuse_sumo=False):
+    
+    # the seed of the exploration strategy
+    random.seed(seed)
+    
+    # a SUMO environment, with the set of routes of each OD-pair
+    env = SUMORouteChoice('nets/OW/OW-traci.sumocfg', port, False, reuse_sumo=reuse_sumo)
+    env.set_routes_KSP('nets/OW/OW_for_KSP.net', 4)
+    
+    # an exploration strategy
+    exp = EpsilonGreedy(epsilon=1, min_epsilon=0.1, decay_rate=0.99)
+    
+    # a learner for each vehicle in the route file
+    for vehID in env.get_vehicles_ID_list():
+        vehDic = env.get_vehicle_dict(vehID)
+        origin = env.encode_OD(vehDic['origin'], vehDic['destination'])
+        _ = QLearner(vehID, env, origin, vehDic['destination'], alpha, gamma, exp)
+    
+    # run the episodes, storing the average travel time of each one
+    avg_tt = []
+    for _ in xrange(n_episodes):
+        env.run_episode(50000)
+        tt = [env.get_vehicle_dict(vehID)['travel_time'] for vehID in env.get_vehicles_ID_list()]
+        avg_tt.append((sum(tt) / len(tt)) / 60)
+    
+    # stop SUMO (if it is reused along the episodes)
+    env.close()
+    
+    return avg_tt
+
+# run the SUMORouteChoice setting with a single SUMO instance for all episodes
+# (rather than one per episode), see experiment_SUMORouteChoice
+def test_SUMORouteChoice_reuse():
+    
+    start = time.time()
+    avg_tt = experiment_SUMORouteChoice(8813, reuse_sumo=True)
+    print 'average travel time (last episode): %f' % avg_tt[-1]
+    print 'runtime: %f seconds' % (time.time() - start)
+
+def test_experiments():
+    
+    # a parameter sweep of the SUMORouteChoice setting, with several seeds per
+    # value of alpha; the runs are spread over all available cores, each one
+    # with its own SUMO instance (and port)
+    settings = [{'alpha': alpha, 'seed': seed} for alpha in [0.1, 0.5, 0.8] for seed in xrange(5)]
+    results = experiments.run_experiments(experiment_SUMORouteChoice, settings)
+    
+    print 'alpha\tseed\tavg tt (last episode)'
+    for setting, avg_tt in zip(settings, results):
+        print '%s\t%s\t%f' % (setting['alpha'], setting['seed'], avg_tt[-1])
+        
+# check that tools.sumoxml.read_net_tls reads the traffic lights, their phases
+# and their controlled lanes whatever the order of the tlLogic and connection
+# elements in the net file
+def test_read_net_tls():
+    
+    edge = '<edge id="a" from="n1" to="J"><lane id="a_0" index="0" length="75.00"/></edge>'
+    tl = '<tlLogic id="J" type="static" programID="0" offset="0"><phase duration="31" state="G"/><phase duration="4" state="y"/></tlLogic>'
+    connection = '<connection from="a" to="b" fromLane="0" toLane="0" tl="J" linkIndex="0"/>'
+    
+    for elements in [[edge, tl, connection], [edge, connection, tl]]:
+        
+        fd, net_file = tempfile.mkstemp(suffix='.net.xml')
+        with os.fdopen(fd, 'w') as f:
+            f.write('<net>%s</net>' % ''.join(elements))
+        try:
+            tls, lengths = sumoxml.read_net_tls(net_file)
+        finally:
+            os.remove(net_file)
+        
+        assert tls == [['J', [[31.0, 'G'], [4.0, 'y']], {0: 'a_0'}]], tls
+        assert lengths == {'a_0': 75.0}, lengths
+    
+    print 'traffic lights read with the connections before and after the programs'
+
 def test_SUMOTrafficLights():
 
 
@@ -164,6 +481,37 @@ def test_SUMOTrafficLights():
     
 	                
 
+def test_SUMO_backends():
+    
+    # compare the simulation speed (in steps per second) achieved with the TraCI
+    # and libsumo backends (see tools/sumobackend.py); the time to start SUMO is
+    # included, since it is relevant when episodes are short and numerous
+    
+    # number of episodes (simulations) per network and backend
+    n_episodes = 10
+    
+    print 'net\tbackend\tsteps\truntime\tsteps/s'
+    
+    for cfg_file in ['nets/OW/OW-traci.sumocfg', 'nets/3x3grid/3x3grid.sumocfg']:
+        for use_libsumo in [False, True]:
+            
+            backend = sumobackend.get_backend(use_libsumo)
+            if use_libsumo and not sumobackend.is_libsumo(backend):
+                print '%s\tlibsumo\t(not installed)' % cfg_file
+                continue
+            
+            steps = 0
+            start = time.time()
+            for _ in xrange(n_episodes):
+                backend.start([sumolib.checkBinary('sumo'), '-c', cfg_file])
+                while backend.simulation.getMinExpectedNumber() > 0:
+                    backend.simulationStep()
+                    steps += 1
+                backend.close()
+            runtime = time.time() - start
+            
+            print '%s\t%s\t%i\t%f\t%f' % (cfg_file, 'libsumo' if use_libsumo else 'traci', steps, runtime, steps / runtime)
+
 def test_NFG():
     
     env = TwoPlayerTwoAction(NFG.GAME_MATCHING_PENNIES)
@@ -241,11 +589,8 @@ def test_OPPORTUNE_route_choice():
     # create a set of routes for each OD-pair (through KSP algorithm),
     # and define one such set for each OD-pair (these sets will correspond 
     # to the actions available on each state)
-    pairs = env.get_OD_pairs()
-    for origin, destination in pairs:
-        RKSP = KSP.getKRoutesNetFile('nets/OW/OW_for_KSP.net', origin, destination, 4)
-        routes = [" ".join(r[0]) for r in RKSP]
-        env.set_routes_OD_pair(origin, destination, routes)
+    # (the routes are cached, so they are computed only in the first run)
+    env.set_routes_KSP('nets/OW/OW_for_KSP.net', 4)
     
     # an exploration strategy
     exp = EpsilonGreedy(0.05, 0)
@@ -394,7 +739,16 @@ if __name__ == '__main__':
     #test_cliff()
     #test_SUMO()
     #test_SUMORouteChoice()
+    #test_SUMORouteChoice_reuse()
+    #test_SUMO_open_files()
+    #test_MacroRouteChoice()
+    #test_MacroRouteChoice_congestion()
+    #test_ArrayQTable()
+    #test_PopulationQLearner()
+    #test_read_net_tls()
     test_SUMOTrafficLights()
+    #test_SUMO_backends()
+    #test_experiments()
     #test_NFG()
     #test_OPPORTUNE()
     #test_OPPORTUNE_route_choice()
@@ -0,0 +1,40 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+import multiprocessing
+
+# Runner of independent experiments (eg, the same setting with different seeds,
+# or a parameter sweep) on a pool of processes. Each run is a call to a given
+# experiment function, which must be defined at module level (so that it can
+# be sent to the worker processes) and must accept the keyword argument port,
+# which is the port to be used by its SUMO environment (each run has its own
+# port, so that runs executing at the same time do not interfere with each
+# other). Whatever the function returns is collected as the run's result.
+
+# execute a single run (in a worker process)
+def _run_experiment(args):
+    experiment, port, setting = args
+    return experiment(port=port, **setting)
+
+# execute experiment(port=..., **setting) for each setting in the given list
+# on a pool with the given number of processes (all available cores if None),
+# where the k-th run uses port base_port+k; the results are returned in the
+# same order as the settings
+def run_experiments(experiment, settings, processes=None, base_port=8813):
+    tasks = [[experiment, base_port + k, setting] for k, setting in enumerate(settings)]
+
+    # run sequentially if a single process is to be used
+    if processes == 1:
+        return [_run_experiment(t) for t in tasks]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # each worker takes one run at a time
+        results = pool.map(_run_experiment, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
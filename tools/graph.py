@@ -0,0 +1,129 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+import numpy as np
+
+class CSRGraph(object):
+    '''
+    A directed graph stored in compressed sparse row (CSR) format. Nodes and
+    edges are identified by integer ids, and the topology is stored in arrays:
+      * the outgoing edges of node u are the edges offsets[u], ..., offsets[u+1]-1
+        (i.e., the edges are sorted by their start nodes)
+      * sources[e], targets[e] and costs[e] are the start node, the end node
+        and the cost of edge e
+    The names of nodes and edges are only used to translate from/to ids.
+    '''
+
+    def __init__(self, node_names, edges):
+        '''
+        Create the graph given the list of node names and the list of edges,
+        each one in the form [name, start node name, end node name, cost].
+        Node ids correspond to the order of node_names (repeated names are
+        ignored). Edge ids follow the order of their start nodes and, within
+        the same start node, the order of edges (the position of each edge in
+        the list of edges is kept in input_index). Edges with unknown start
+        or end nodes are ignored.
+        '''
+
+        # name <-> id tables of nodes
+        self.node_names = []
+        self.node_ids = {}
+        for name in node_names:
+            if name not in self.node_ids:
+                self.node_ids[name] = len(self.node_names)
+                self.node_names.append(name)
+
+        # valid edges (in the form [position in edges, start id, end id]),
+        # sorted (stably) by start node
+        valid = [[i, self.node_ids[e[1]], self.node_ids[e[2]]] for i, e in enumerate(edges) if e[1] in self.node_ids and e[2] in self.node_ids]
+        valid.sort(key=lambda x: x[1])
+
+        # edges' arrays
+        self.input_index = np.array([x[0] for x in valid], dtype=np.int64)
+        self.sources = np.array([x[1] for x in valid], dtype=np.int64)
+        self.targets = np.array([x[2] for x in valid], dtype=np.int64)
+        self.costs = np.array([float(edges[x[0]][3]) for x in valid], dtype=np.float64)
+        self.offsets = np.zeros(len(self.node_names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sources, minlength=len(self.node_names)), out=self.offsets[1:])
+
+        # name <-> id tables of edges (an edge name may be shared by several
+        # edges, eg, the two directions of an undirected edge, in which case
+        # edge_ids refers to the first one)
+        self.edge_names = [edges[x[0]][0] for x in valid]
+        self.edge_ids = {}
+        for e, name in enumerate(self.edge_names):
+            if name not in self.edge_ids:
+                self.edge_ids[name] = e
+
+        # the first edge (in the input order) between each pair of nodes
+        self.pair_ids = {}
+        for e in xrange(len(valid)):
+            self.pair_ids.setdefault((valid[e][1], valid[e][2]), e)
+
+        self.__lists = None
+        self.__reverse = None
+
+    @classmethod
+    def from_sumo_net(cls, net):
+        '''
+        Create the graph of a SUMO network (as read by sumolib.net.readNet),
+        where the cost of each edge is its free-flow travel time (in seconds).
+        '''
+        nodes = [n.getID().encode('utf-8') for n in net.getNodes()]
+        edges = []
+        for n in net.getNodes():
+            for e in n.getOutgoing():
+                edges.append([e.getID().encode('utf-8'), e.getFromNode().getID().encode('utf-8'), e.getToNode().getID().encode('utf-8'), e.getLength() / e.getSpeed()])
+        return cls(nodes, edges)
+
+    def n_nodes(self):
+        return len(self.node_names)
+
+    def n_edges(self):
+        return len(self.edge_names)
+
+    def lists(self):
+        '''
+        Return the offsets, targets and costs arrays as Python lists, which are
+        much faster than NumPy arrays when accessed element by element (as in
+        pure-Python graph searches). The lists are created once and kept.
+        '''
+        if self.__lists is None:
+            self.__lists = [self.offsets.tolist(), self.targets.tolist(), self.costs.tolist()]
+        return self.__lists
+
+    def reverse(self):
+        '''
+        Return the reverse topology in the form [offsets, edges], where the
+        incoming edges of node v are edges[offsets[v]], ..., edges[offsets[v+1]-1]
+        (as Python lists, see lists()).
+        '''
+        if self.__reverse is None:
+            order = np.argsort(self.targets, kind='mergesort')
+            offsets = np.zeros(len(self.node_names) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=len(self.node_names)), out=offsets[1:])
+            self.__reverse = [offsets.tolist(), order.tolist()]
+        return self.__reverse
+
+    def set_costs(self, edge_ids, costs):
+        # update the cost of the given edges
+        self.costs[edge_ids] = costs
+        if self.__lists is not None:
+            self.__lists[2] = self.costs.tolist()
+
+    def out_edges(self, node_id):
+        # return the ids of the edges starting in the given node
+        return xrange(self.offsets[node_id], self.offsets[node_id + 1])
+
+    def out_edge_names(self, node_name):
+        # return the names of the edges starting in the given node
+        offsets = self.lists()[0]
+        u = self.node_ids[node_name]
+        return self.edge_names[offsets[u]:offsets[u + 1]]
+
+    def edge_endpoints(self, edge_name):
+        # return the names of the start and end nodes of the given edge
+        e = self.edge_ids[edge_name]
+        return [self.node_names[self.sources[e]], self.node_names[self.targets[e]]]
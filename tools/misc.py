@@ -6,8 +6,13 @@ Created on 25/11/2014
 from xml.dom import minidom
 import datetime
 
-# convert SUMO cfg/net files to the graph format accepted by the KSP script
-def convert_SUMO_to_KSP(file_name):
+# convert SUMO cfg/net files to the graph format accepted by the KSP script;
+# by default, the cost of each link is its free-flow travel time (fftt, in
+# minutes), regardless of its flow; if capacity is given, the cost follows the
+# BPR function fftt*(1+0.15*(f/cap)^4) instead, where f is the link's flow and
+# cap is its number of lanes times capacity (the number of vehicles per lane
+# that the link supports along an episode), so that the links get congested
+def convert_SUMO_to_KSP(file_name, capacity=None):
     
     net_file_name = file_name
     
@@ -33,7 +38,10 @@ def convert_SUMO_to_KSP(file_name):
     print '##################################################'
     
     # print the function type
-    print 'function simple_function (f) fftt+f-f'
+    if capacity is None:
+        print 'function simple_function (f) fftt+f-f'
+    else:
+        print 'function bpr (f) fftt*(1+0.15*(f/cap)^4)'
     
     # process the nodes
     nodes = minidom.parse(net_file_name).getElementsByTagName('junction')
@@ -64,7 +72,11 @@ def convert_SUMO_to_KSP(file_name):
             weight = (float(length) / float(speed)) / 60
             
             # print as an arc
-            print 'dedge %s %s %s simple_function %f' % (e.attributes['id'].value, e.attributes['from'].value, e.attributes['to'].value, weight)
+            if capacity is None:
+                print 'dedge %s %s %s simple_function %f' % (e.attributes['id'].value, e.attributes['from'].value, e.attributes['to'].value, weight)
+            else:
+                cap = len(e.getElementsByTagName('lane')) * capacity
+                print 'dedge %s %s %s bpr %f %f' % (e.attributes['id'].value, e.attributes['from'].value, e.attributes['to'].value, weight, cap)
     
     # OD pairs are not printed here because they are no used
     
\ No newline at end of file
@@ -0,0 +1,72 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+import traci
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
+
+# Backends available to drive SUMO's simulations: TraCI, which runs SUMO in a
+# separate process and communicates through a socket, and libsumo, which runs
+# SUMO within the Python process itself (no process startup nor IPC costs).
+# Both offer the same API (traci.start, traci.vehicle, ...), so the environments
+# simply call the methods of the backend module returned by get_backend(...).
+# The constants (traci.constants) are shared by both backends.
+
+# return the backend module: libsumo, if requested and installed, or traci
+# otherwise (libsumo does not support the GUI, so traci is used in such a case)
+def get_backend(use_libsumo=False, use_gui=False):
+    if use_libsumo and not use_gui and libsumo is not None:
+        return libsumo
+    return traci
+
+# return whether the given backend is libsumo
+def is_libsumo(backend):
+    return libsumo is not None and backend is libsumo
+
+# return the traffic lights domain of the backend (which was renamed from
+# trafficlights to trafficlight in SUMO 1.0; libsumo only has the latter)
+def trafficlight_domain(backend):
+    if hasattr(backend, 'trafficlight'):
+        return backend.trafficlight
+    return backend.trafficlights
+
+# return the subscription results of all objects of the given domain (eg,
+# backend.vehicle), as a dictionary {object ID: {variable: value}}
+def all_subscription_results(domain):
+    if hasattr(domain, 'getAllSubscriptionResults'):
+        return domain.getAllSubscriptionResults()
+    return domain.getSubscriptionResults(None)
+
+# create a traffic light program (to be used with setCompleteRedYellowGreenDefinition)
+# with the given ID and phases, where each phase is a pair [duration, state] and
+# the duration is given in milliseconds
+def create_tl_logic(backend, program_ID, phases):
+    if is_libsumo(backend): # libsumo (durations in seconds)
+        return libsumo.TraCILogic(program_ID, 0, 0, [libsumo.TraCIPhase(d / 1000.0, s) for d, s in phases])
+    elif hasattr(traci, '_trafficlights'): # TraCI < 1.0 (durations in milliseconds)
+        return traci._trafficlights.Logic(program_ID, 0, 0, 0, [traci._trafficlights.Phase(d, d, d, s) for d, s in phases])
+    else: # TraCI >= 1.0 (durations in seconds)
+        return traci.trafficlight.Logic(program_ID, 0, 0, [traci.trafficlight.Phase(d / 1000.0, s) for d, s in phases])
+
+# start SUMO with the given command line (listening to the given port) and
+# return the object through which the simulation is driven: the TraCI
+# connection with the given label, so that several simulations may run at
+# the same time (each environment with its own connection), or the libsumo
+# module itself (libsumo supports a single simulation per process, so the
+# port and the label are ignored)
+def start(backend, cmd, port=None, label='default'):
+    if is_libsumo(backend):
+        backend.start(cmd)
+        return backend
+    backend.start(cmd, port=port, label=label)
+    return backend.getConnection(label)
+
+# stop the simulation started (see start(...)) with the given label
+def close(backend, label='default'):
+    if not is_libsumo(backend):
+        backend.switch(label)
+    backend.close()
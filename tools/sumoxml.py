@@ -0,0 +1,131 @@
+'''
+Created on 18/10/2026
+
+@author: Gabriel de O. Ramos <goramos@inf.ufrgs.br>
+'''
+import xml.etree.cElementTree as ET
+import os
+
+# Streaming (single-pass) readers of SUMO's XML files. The files are read with
+# iterparse and each top-level element is discarded as soon as it is processed,
+# so that the memory used does not depend on the size of the file (as opposed
+# to minidom, which keeps the whole document in memory).
+
+# return the attribute's value as a string (utf-8 encoded), or default if
+# the element does not have such an attribute
+def _attr(element, name, default=''):
+    value = element.get(name)
+    if value is None:
+        return default
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+# iterate over the top-level elements of the given XML file (i.e., the children
+# of its root element), which are discarded after being processed by the caller
+def iter_top_elements(xml_file):
+    depth = 0
+    root = None
+    for event, element in ET.iterparse(xml_file, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                yield element
+                root.clear()
+
+# return a dictionary with the options defined in the given SUMO configuration
+# file, in the form {option: value} (eg, {'net-file': 'net.xml', ...})
+def read_cfg(cfg_file):
+    options = {}
+    for section in iter_top_elements(cfg_file):
+        if section.get('value') is not None: # options defined outside sections
+            options[section.tag] = _attr(section, 'value')
+        for option in section:
+            options[option.tag] = _attr(option, 'value')
+    return options
+
+# return the paths of the network and route files defined in the given
+# SUMO configuration file (relative to the configuration file's directory)
+def read_cfg_files(cfg_file):
+    options = read_cfg(cfg_file)
+    path = cfg_file[:cfg_file.rfind("/")+1]
+    return [path + options['net-file'], path + options['route-files']]
+
+# return the list of vehicles defined in the given route file (in the order
+# they are defined), where each vehicle is represented as a list in the form
+# [ID, route, depart, vType] and route is the string with the route's edges;
+# the vehicle's route may be defined by a child route tag or by the route
+# attribute (either the route's ID or the list of edges itself)
+def read_vehicles(rou_file):
+
+    # the routes defined by ID
+    R = {}
+
+    vehicles = []
+    for element in iter_top_elements(rou_file):
+
+        # routes defined by ID (either in the top level or within other elements)
+        for r in element.iter('route'):
+            if r.get('id') is not None:
+                R[_attr(r, 'id')] = _attr(r, 'edges')
+
+        if element.tag == 'vehicle':
+
+            # process the vehicle's route
+            if element.get('route') is not None: # list of edges or route ID
+                route = _attr(element, 'route')
+            else: # child route tag
+                route = _attr(element.iter('route').next(), 'edges')
+
+            vehicles.append([_attr(element, 'id'), route, _attr(element, 'depart'), _attr(element, 'vType')])
+
+    # replace the route IDs by the corresponding edges (this is done only here
+    # because the routes may be defined after the vehicles that use them)
+    for v in vehicles:
+        if v[1] in R:
+            v[1] = R[v[1]]
+
+    return vehicles
+
+# return the traffic lights defined in the given network file (in the order
+# they are defined), where each traffic light is represented as a list in the
+# form [ID, phases, links]; phases is the list of phases of the traffic light's
+# program (the first one, if several are defined), each in the form [duration
+# (in seconds), state], and links is a dictionary {link index: incoming lane}
+# with the lanes controlled by each position of the phases' states; the lengths
+# of the lanes (internal lanes excepted) are returned as well, in the form
+# {lane: length}
+def read_net_tls(net_file):
+
+    # the controlled links of each traffic light, in the form {tlID: {link index: lane}}
+    # (the connections may be defined before or after the traffic lights' programs)
+    L = {}
+
+    # the traffic lights whose programs were already read (only the first
+    # program of each traffic light is considered)
+    read = set()
+
+    tls = []
+    lengths = {}
+    for element in iter_top_elements(net_file):
+
+        if element.tag == 'edge' and element.get('function') != 'internal':
+            for lane in element.iter('lane'):
+                lengths[_attr(lane, 'id')] = float(lane.get('length'))
+
+        elif element.tag == 'tlLogic':
+            tlID = _attr(element, 'id')
+            if tlID not in read:
+                read.add(tlID)
+                phases = [[float(p.get('duration')), _attr(p, 'state')] for p in element.iter('phase')]
+                tls.append([tlID, phases, L.setdefault(tlID, {})])
+
+        elif element.tag == 'connection' and element.get('tl') is not None:
+            lane = '%s_%s' % (_attr(element, 'from'), _attr(element, 'fromLane'))
+            L.setdefault(_attr(element, 'tl'), {})[int(element.get('linkIndex'))] = lane
+
+    return tls, lengths